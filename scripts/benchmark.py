@@ -0,0 +1,304 @@
+"""Benchmark the blog builder on synthetic corpora.
+
+Generates ``source_txt``-style corpora (1k / 10k / 100k entries by default)
+and times each phase of the build separately: parsing, grouping and anchor
+assignment, entry fragments, each page family and the disk writes. Results
+are written as JSON; with ``--baseline`` the run fails (exit status 1) when
+a phase got slower than the baseline by more than ``--max-regression``.
+
+    python scripts/benchmark.py --sizes 1000,10000 --save-baseline bench_baseline.json
+    python scripts/benchmark.py --sizes 1000,10000 --baseline bench_baseline.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import build  # noqa: E402
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_WORKDIR = os.path.join(REPO_ROOT, '.build_cache', 'benchmark')
+DEFAULT_OUTPUT = os.path.join(REPO_ROOT, '.build_cache', 'benchmark.json')
+
+# Bump when the generator changes so cached corpora are regenerated
+CORPUS_VERSION = 1
+
+PHASES = ['parse', 'group', 'fragments',
+          'render_month', 'render_category', 'render_top', 'render_master', 'write']
+
+
+# =============================
+# Synthetic corpus
+# =============================
+
+# 本文の素材（実際の記事に近い文字種・長さになるように）
+SENTENCES = [
+    "今日はウディタの新機能の実装を進めていました。",
+    "思ったより時間がかかってしまいましたが、なんとか形になりました！",
+    "テストプレイしてくださった皆さん、ありがとうございます。",
+    "バグ報告をいただいた件は次のバージョンで修正予定です。",
+    "マップチップの描き直しがようやく終わりました。",
+    "イベントの処理順序を見直したら、だいぶ軽くなりました。",
+    "シナリオの第二章がおおよそ完成です。",
+    "寒くなってきたので皆さんも体調にはお気を付けください。",
+    "作業中のスクリーンショットを載せておきます。",
+    "ちなみに、ここはまだ仮のグラフィックです。",
+    "戦闘バランスの調整は最後にまとめてやる予定です。",
+    "なにごともバランスが大事、ってことで。",
+    "次回の更新はもう少し早くできるよう頑張ります……！",
+    "詳しくは追記をご覧ください。",
+    "ダンジョン生成の乱数まわりを少し改良しました。",
+]
+EXTENDED_SENTENCES = [
+    "以下、細かい技術的な話です。",
+    "コモンイベントの引数を3つから5つに増やしました。",
+    "変数操作の処理を一つにまとめたら可読性が上がりました。",
+    "このあたりは今後のアップデートで変わるかもしれません。",
+]
+HEADINGS = ["【今回の作業内容】", "【今回、作業していて思ったこと】", "【お知らせ】", "【おまけ】"]
+TITLE_WORDS = ["開発状況", "近況", "更新しました", "ウディタ", "新マップ", "イラスト", "バグ修正",
+               "シナリオ", "戦闘", "公安編", "体験版", "お知らせ", "25%", "進捗", "雑記"]
+
+
+def category_weights(categories: list[str]) -> list[float]:
+    """Skewed weights: the first categories in categories.json are the common ones."""
+    return [1.0 / (i + 1) for i in range(len(categories))]
+
+
+def make_body(rng: random.Random, date: datetime, sentences: list[str], lines: int) -> str:
+    out = []
+    for _ in range(lines):
+        r = rng.random()
+        if r < 0.06:
+            stamp = date.strftime('%Y%m%d')
+            out.append(f'<img src="../../image/{date.year}/{stamp}_{rng.randrange(10)}.jpg" '
+                       f'border="0" loading="lazy" height="{rng.choice([240, 300, 360])}">')
+        elif r < 0.09:
+            out.append(f'<strong><span style="font-size:large;">{rng.choice(HEADINGS)}</span></strong>')
+        elif r < 0.15:
+            out.append("")
+        else:
+            out.append("".join(rng.choice(sentences) for _ in range(rng.randint(1, 3))))
+    return "\n".join(out)
+
+
+def generate_corpus(path: str, count: int, seed: int = 1):
+    """Write ``count`` entries into ``path``/source_txt (one file per year) plus design/."""
+    rng = random.Random(seed)
+    design = os.path.join(path, 'design')
+    if os.path.isdir(design):
+        shutil.rmtree(design)
+    shutil.copytree(os.path.join(REPO_ROOT, 'design'), design)
+    with open(os.path.join(design, 'categories.json'), encoding='utf-8') as f:
+        categories = list(json.load(f))
+    weights = category_weights(categories)
+
+    source_dir = os.path.join(path, 'source_txt')
+    if os.path.isdir(source_dir):
+        shutil.rmtree(source_dir)
+    os.makedirs(source_dir)
+
+    start = datetime(2003, 1, 1)
+    span = (datetime(2026, 6, 30) - start).total_seconds()
+    # Dates spread evenly with jitter; busy days get several entries
+    dates = sorted(start + timedelta(seconds=rng.random() * span) for _ in range(count))
+    by_year: dict[int, list[str]] = {}
+    for date in dates:
+        r = rng.random()
+        if r < 0.02:
+            cats = ""
+        elif r < 0.07:
+            cats = ", ".join(sorted(set(rng.choices(categories, weights, k=2)), key=categories.index))
+        else:
+            cats = rng.choices(categories, weights)[0]
+        title = " ".join(rng.sample(TITLE_WORDS, rng.randint(1, 3)))
+        lines = ["TITLE: " + title]
+        if cats:
+            lines.append("CATEGORY: " + cats)
+        lines += [f"DATE: {date:%Y-%m-%d %H:%M:%S}", "-----", "BODY:",
+                  make_body(rng, date, SENTENCES, rng.randint(5, 30)), "-----", "EXTENDED BODY:"]
+        if rng.random() < 0.3:
+            lines.append(make_body(rng, date, EXTENDED_SENTENCES, rng.randint(3, 15)))
+        lines += ["", "-----", "--------", ""]
+        by_year.setdefault(date.year, []).append("\n".join(lines))
+    for year, blocks in by_year.items():
+        with open(os.path.join(source_dir, f'{year}.txt'), 'w', encoding='utf-8') as f:
+            f.write("".join(blocks))
+
+    with open(os.path.join(path, 'corpus.json'), 'w', encoding='utf-8') as f:
+        json.dump({'version': CORPUS_VERSION, 'count': count, 'seed': seed}, f)
+
+
+def ensure_corpus(workdir: str, count: int, seed: int) -> str:
+    """Return the directory of the corpus, generating it unless already there."""
+    path = os.path.join(workdir, f'corpus-{count}-{seed}')
+    try:
+        with open(os.path.join(path, 'corpus.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+    except (FileNotFoundError, ValueError):
+        meta = {}
+    if meta != {'version': CORPUS_VERSION, 'count': count, 'seed': seed}:
+        print(f"generating corpus: {count} entries ...", file=sys.stderr)
+        os.makedirs(path, exist_ok=True)
+        generate_corpus(path, count, seed)
+    return path
+
+
+# =============================
+# Timed build
+# =============================
+
+def run_build(path: str) -> dict:
+    """Run one full (non-incremental) build of the corpus at ``path``, timing each phase."""
+    timings = dict.fromkeys(PHASES, 0.0)
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        for stale in ('docs', '.build_cache'):
+            shutil.rmtree(stale, ignore_errors=True)
+
+        t = time.perf_counter()
+        entries = [e for e in build.parse_entries('source_txt', cache_path=None) if e.date]
+        timings['parse'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        entries.sort(key=lambda e: e.date)
+        site = build.prepare_site(entries, build.load_cat_dir_map(), 'docs')
+        site['layout'] = build.PageLayout(site, build.load_templates())
+        timings['group'] = time.perf_counter() - t
+
+        t = time.perf_counter()
+        entry_digests = {e.anchor_id: build.entry_digest(e) for e in entries}
+        fragments = build.EntryFragments(build.FRAGMENT_CACHE_PATH, 'benchmark')
+        fragments.prepare(entries, entry_digests)
+        site['fragments'] = fragments
+        timings['fragments'] = time.perf_counter() - t
+
+        writer = build.SiteWriter('docs')
+        specs = build.plan_pages(site)
+        for spec in specs:
+            t = time.perf_counter()
+            content = build.render_page(site, spec)
+            t2 = time.perf_counter()
+            writer.write(build.page_path(site, spec), content)
+            timings['write'] += time.perf_counter() - t2
+            timings['render_' + spec[0]] += t2 - t
+        fragments.save()
+    finally:
+        os.chdir(cwd)
+        for data in build._source_maps.values():
+            data.close()
+        build._source_maps.clear()
+        # Only the corpus is worth keeping; the output of 100k entries is ~2 GB
+        for output in ('docs', '.build_cache'):
+            shutil.rmtree(os.path.join(path, output), ignore_errors=True)
+
+    source_bytes = sum(os.path.getsize(p) for p in
+                       glob.glob(os.path.join(path, 'source_txt', '*.txt')))
+    return {
+        'entries': len(entries),
+        'pages': len(specs),
+        'source_bytes': source_bytes,
+        'phases': timings,
+    }
+
+
+def benchmark(sizes: list[int], workdir: str, seed: int, repeat: int) -> dict:
+    results = {}
+    for count in sizes:
+        path = ensure_corpus(workdir, count, seed)
+        runs = [run_build(path) for _ in range(repeat)]
+        result = runs[0]
+        # Best of N per phase: the least disturbed by other load on the machine
+        result['phases'] = {p: min(r['phases'][p] for r in runs) for p in PHASES}
+        result['total'] = sum(result['phases'].values())
+        results[str(count)] = result
+        print(format_result(count, result), file=sys.stderr)
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'repeat': repeat,
+        'sizes': results,
+    }
+
+
+def format_result(count: int, result: dict) -> str:
+    phases = "  ".join(f"{p}={t * 1000:.0f}ms" for p, t in result['phases'].items())
+    return f"{count:>7} entries, {result['pages']} pages: total={result['total']:.2f}s  {phases}"
+
+
+def compare(report: dict, baseline: dict, max_regression: float, min_time: float) -> list[str]:
+    """Return a message for each phase slower than the baseline beyond the threshold.
+
+    Phases under ``min_time`` seconds in the baseline are too noisy to judge
+    and are skipped, as are sizes the baseline does not have.
+    """
+    failures = []
+    for size, result in report['sizes'].items():
+        base = baseline.get('sizes', {}).get(size)
+        if not base:
+            continue
+        for phase in PHASES + ['total']:
+            new = result['phases'][phase] if phase != 'total' else result['total']
+            old = base['phases'].get(phase) if phase != 'total' else base.get('total')
+            if old is None or old < min_time:
+                continue
+            if new > old * (1 + max_regression):
+                failures.append(f"{size} entries: {phase} {old * 1000:.0f}ms -> {new * 1000:.0f}ms "
+                                f"(+{(new / old - 1) * 100:.0f}%)")
+    return failures
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Time the build phases on synthetic corpora.")
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help="comma-separated corpus sizes in entries (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=1, metavar='N',
+                        help="builds per size; the fastest time of each phase is kept")
+    parser.add_argument('--seed', type=int, default=1, help="random seed of the generated corpora")
+    parser.add_argument('--workdir', default=DEFAULT_WORKDIR,
+                        help="where corpora are generated and reused (default: .build_cache/benchmark)")
+    parser.add_argument('--output', '-o', default=DEFAULT_OUTPUT,
+                        help="JSON results file (default: .build_cache/benchmark.json)")
+    parser.add_argument('--baseline', metavar='FILE', help="results of an earlier run to compare against")
+    parser.add_argument('--save-baseline', metavar='FILE', help="also write the results to FILE")
+    parser.add_argument('--max-regression', type=float, default=0.25, metavar='RATIO',
+                        help="allowed slowdown per phase vs the baseline (default: %(default)s = +25%%)")
+    parser.add_argument('--min-time', type=float, default=0.01, metavar='SECONDS',
+                        help="ignore phases faster than this in the baseline (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    report = benchmark(sizes, os.path.abspath(args.workdir), args.seed, max(1, args.repeat))
+
+    for path in filter(None, [args.output, args.save_baseline]):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+            f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        failures = compare(report, baseline, args.max_regression, args.min_time)
+        if failures:
+            print("performance regression:", file=sys.stderr)
+            for line in failures:
+                print("  " + line, file=sys.stderr)
+            return 1
+        print(f"no regression vs {args.baseline}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,10 +1,24 @@
+import argparse
 import os
 import glob
 from datetime import datetime, timedelta, timezone
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import cProfile
+import hashlib
 import html
 import json
+import mmap
+import pickle
+import posixpath
 import re
+import sqlite3
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
 import urllib.parse
 
 # Fixed timezone for Japanese local time
@@ -25,87 +39,496 @@ secret_text = os.environ.get("FINAL_LETTER_TEXT_SECRET", "[NO SECRET]")
 # Utility helpers
 # =============================
 
-def parse_entries(source_dir: str = "source_txt"):
-    """Parse all Markdown sources into a flat list of dicts."""
-    entries = []
-    for path in sorted(glob.glob(os.path.join(source_dir, "*.txt"))):
-        with open(path, encoding="utf-8") as f:
-            content = f.read()
-        # Each entry is delimited by 8 hyphens on its own line (--------)
-        raw_entries = content.split("--------")
-        for raw in raw_entries:
-            raw = raw.strip()
-            if not raw:
-                continue
-            lines = [ln.rstrip("\n") for ln in raw.splitlines()]
-            idx = 0
+# On-disk cache of parsed entries, one record set per source file. Kept out
+# of docs/ (see .gitignore) because it is only a local/CI speed-up.
+PARSE_CACHE_PATH = os.path.join('.build_cache', 'parse_cache.pickle')
+PARSE_CACHE_VERSION = 7
 
-            # TITLE (required)
-            if idx < len(lines) and lines[idx].startswith("TITLE:"):
-                title = lines[idx][len("TITLE:"):].strip()
-                idx += 1
-            else:
-                continue  # Skip malformed block
+# Rendered entry fragments (see EntryFragments), reused across builds.
+FRAGMENT_CACHE_PATH = os.path.join('.build_cache', 'fragments.sqlite')
 
-            # CATEGORY (optional, comma-separated allowed)
-            if idx < len(lines) and lines[idx].startswith("CATEGORY:"):
-                category_line = lines[idx][len("CATEGORY:"):].strip()
-                idx += 1
-            else:
-                category_line = ""
-            categories = [c.strip() for c in category_line.split(',') if c.strip()] if category_line else []
-
-            # DATE (optional but expected)
-            if idx < len(lines) and lines[idx].startswith("DATE:"):
-                date_str = lines[idx][len("DATE:"):].strip()
-                idx += 1
-                try:
-                    date = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
-                except ValueError:
-                    date = datetime.strptime(date_str, "%Y-%m-%d")
-                date = date.replace(tzinfo=JST)
-            else:
-                date = None
-                date_str = ""
+SECRET_PLACEHOLDER = "{{FINAL_LETTER_TEXT_SECRET}}"
 
-            # Skip to BODY:
-            while idx < len(lines) and lines[idx] != "BODY:":
-                idx += 1
-            if idx < len(lines):
-                idx += 1  # skip "BODY:"
+# Entries are separated by ENTRY_DELIMITER lines; BODY and EXTENDED BODY
+# are closed by SECTION_DELIMITER lines.
+ENTRY_DELIMITER = "--------"
+SECTION_DELIMITER = "-----"
 
-            body_lines: list[str] = []
-            while idx < len(lines) and lines[idx] != "-----":
-                body_lines.append(lines[idx])
-                idx += 1
+_SECTION_MARK = b"\n" + SECTION_DELIMITER.encode()
 
-            # consume ----- delimiters after body
-            while idx < len(lines) and lines[idx] == "-----":
-                idx += 1
+DATE_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})(?: (\d{2}):(\d{2}):(\d{2}))?")
+
+
+def _is_entry_delimiter(line: str) -> bool:
+    # Trailing whitespace (e.g. "-------- ") is invisible in most editors
+    return line.rstrip() == ENTRY_DELIMITER
+
+
+def _is_section_delimiter(line: str) -> bool:
+    return line.rstrip() == SECTION_DELIMITER
+
+
+def report_issue(source: str, lineno: int, message: str):
+    """Default parse problem reporter: a compiler-style warning on stderr."""
+    print(f"{source}:{lineno}: warning: {message}", file=sys.stderr)
+
+
+def parse_date(date_str: str) -> datetime:
+    """Parse ``YYYY-MM-DD[ HH:MM:SS]`` as JST. Raises ValueError if malformed."""
+    m = DATE_RE.fullmatch(date_str)
+    if m:
+        # Fast path for the canonical form; strptime is comparatively slow
+        return datetime(*(int(v) for v in m.groups() if v is not None), tzinfo=JST)
+    try:
+        date = datetime.strptime(date_str, "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        date = datetime.strptime(date_str, "%Y-%m-%d")
+    return date.replace(tzinfo=JST)
+
+
+class SourceReader:
+    """Line reader over the bytes of a source file (usually an mmap).
+
+    Keeps track of the byte offset and line number. :meth:`skip_text` jumps
+    over whole runs of body lines with ``find`` instead of handling them one
+    by one; body text itself is never decoded while parsing.
+    """
 
+    def __init__(self, data):
+        self.data = data
+        self.size = len(data)
+        self.pos = 0
+        self.lineno = 0  # number of the line last consumed
+
+    def readline(self) -> str | None:
+        """Return the next line without its newline, or None at EOF."""
+        if self.pos >= self.size:
+            return None
+        i = self.data.find(b"\n", self.pos)
+        end = self.size if i < 0 else i
+        line = self.data[self.pos:end]
+        self.pos = end + 1
+        self.lineno += 1
+        if line.endswith(b"\r"):
+            line = line[:-1]
+        return line.decode("utf-8")
+
+    def skip_text(self):
+        """Skip lines up to (not including) the next one starting with ``-----``."""
+        mark = _SECTION_MARK
+        if self.pos >= self.size or self.data[self.pos:self.pos + len(mark) - 1] == mark[1:]:
+            return
+        i = self.data.find(mark, self.pos)
+        end = self.size if i < 0 else i + 1
+        skipped = self.data[self.pos:end]
+        self.lineno += skipped.count(b"\n")
+        if not skipped.endswith(b"\n"):
+            self.lineno += 1  # last line of the file without a newline
+        self.pos = end
+
+
+def _glued_title(line: str) -> str | None:
+    """The ``TITLE:`` part of a line like ``--------TITLE: ...``, else None.
+
+    Appending an entry to a file that does not end with a newline glues the
+    delimiter of the new entry to the last line; the old split-based parser
+    took such a line as a boundary too.
+    """
+    if line.startswith(ENTRY_DELIMITER):
+        rest = line[len(ENTRY_DELIMITER):].lstrip()
+        if rest.startswith("TITLE:"):
+            return rest
+    return None
+
+
+def _read_section(reader: SourceReader) -> tuple[tuple[int, int], str | None, int | None]:
+    """Find the extent of a BODY / EXTENDED BODY section.
+
+    Returns ``(span, next line, boundary)``. ``span`` is the byte range of
+    the text. ``boundary`` is None if the section was closed by ``-----``,
+    otherwise the line number where the next entry starts (the
+    ``--------`` line, or one past EOF) and ``next line`` is its TITLE line.
+    A ``--------`` line is only a boundary when followed by a ``TITLE:``
+    (or when the TITLE is glued to it, see :func:`_glued_title`).
+    """
+    start = reader.pos
+    pending = None  # a line already read but not examined yet
+    while True:
+        if pending is None:
+            reader.skip_text()
+            line_start = reader.pos
+            line = reader.readline()
+        else:
+            line, line_start = pending
+            pending = None
+        if line is None:
+            return (start, reader.size), None, reader.lineno + 1
+        if _is_section_delimiter(line):
+            return (start, line_start), reader.readline(), None
+        if _glued_title(line) is not None:
+            return (start, line_start), line, reader.lineno
+        if _is_entry_delimiter(line):
+            boundary, boundary_pos = reader.lineno, line_start
+            while True:
+                line_start = reader.pos
+                line = reader.readline()
+                if line is None or line.strip():
+                    break
+            if line is None or line.lstrip().startswith("TITLE:"):
+                return (start, boundary_pos), line, boundary
+            # Not an entry boundary: the separator was part of the text
+            pending = (line, line_start)
+
+
+# -------------------------
+# Asset references
+# -------------------------
+
+# Published asset directories under docs/ and the sources they are synced
+# from (see scripts/sync_assets.py)
+ASSET_SOURCES = [('image', 'source_img'), ('js', 'source_js')]
+
+# src= / href= attribute values, quoted or not. find_asset_refs() runs over
+# every body while parsing, so it locates the attribute names with bytes.find
+# and only matches the value part (_ASSET_VALUE_RE) there; an IGNORECASE
+# scan with ASSET_REF_RE is ~3x slower. Both find the same references.
+ASSET_REF_RE = re.compile(rb"""\b(?:src|href)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.IGNORECASE)
+_ASSET_VALUE_RE = re.compile(rb"""\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""")
+_WORD_BYTE_RE = re.compile(rb"\w")
+
+# Entry bodies are shown on pages two levels below docs/ (archive/YYYY,
+# category/xxx, archive/top), so their relative URLs resolve from here.
+_ENTRY_PAGE_DIR = 'archive/_'
+
+
+def asset_path(url: str, page_dir: str = _ENTRY_PAGE_DIR) -> str | None:
+    """docs/-relative path of a local image/js URL used on a page in ``page_dir``.
+
+    Returns None for external links, anchors and anything outside the
+    published asset directories.
+    """
+    url = url.strip()
+    if not url or url.startswith(('#', '/')) or ':' in url.split('/', 1)[0]:
+        return None
+    path = urllib.parse.unquote(url.split('#', 1)[0].split('?', 1)[0])
+    path = posixpath.normpath(posixpath.join(page_dir, path))
+    if path.startswith(tuple(d + '/' for d, _ in ASSET_SOURCES)):
+        return path
+    return None
+
+
+def locate_asset(ref: str, root: str = 'docs') -> str | None:
+    """The file behind a docs/-relative asset path: its source if any, else the published copy."""
+    top, rest = ref.split('/', 1)
+    for path in (os.path.join(dict(ASSET_SOURCES)[top], rest), os.path.join(root, ref)):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _ref_urls(text: bytes) -> list[bytes]:
+    """The src= / href= values in ``text``, as ``ASSET_REF_RE.finditer`` finds them."""
+    lower = text.lower()
+    found = []
+    for name in (b"src", b"href"):
+        i = lower.find(name)
+        while i >= 0:
+            if not (i and _WORD_BYTE_RE.match(lower, i - 1)):
+                m = _ASSET_VALUE_RE.match(text, i + len(name))
+                if m:
+                    found.append((i, m.end(), m.group(m.lastindex)))
+            i = lower.find(name, i + 1)
+    found.sort()
+    urls = []
+    end = 0
+    for start, stop, url in found:
+        if start >= end:  # not inside the value of the previous match
+            urls.append(url)
+            end = stop
+    return urls
+
+
+def find_asset_refs(text: bytes, page_dir: str = _ENTRY_PAGE_DIR) -> list[str]:
+    """Local image/js paths referenced from HTML ``text`` (bytes), in order."""
+    refs = []
+    for url in _ref_urls(text):
+        if url.startswith((b'http:', b'https:')):  # most external links, skipped before decoding
+            continue
+        path = asset_path(url.decode('utf-8', 'replace'), page_dir)
+        if path and path not in refs:
+            refs.append(path)
+    return refs
+
+
+def _scan_span(data, span: tuple[int, int], check_secret: bool) -> tuple[str, bool, list[str]]:
+    """Digest of a section's bytes, whether it contains the secret placeholder,
+    and the assets it references."""
+    raw = data[span[0]:span[1]]
+    refs = find_asset_refs(raw) if b'=' in raw else []
+    return hashlib.sha1(raw).hexdigest(), check_secret and SECRET_PLACEHOLDER.encode() in raw, refs
+
+
+def _parse_entry(reader: SourceReader, title_line: str, source: str, report) -> tuple['Entry', str | None]:
+    """Parse one entry whose TITLE line has just been read.
+
+    Returns the entry and the next line the caller has to look at.
+    """
+    title = title_line[len("TITLE:"):].strip()
+    category = ""
+    categories: list[str] = []
+    date = None
+    date_str = ""
+    line_start = reader.lineno
+    body_span = extended_span = (0, 0)
+    line = reader.readline()
+
+    # CATEGORY (optional, comma-separated allowed)
+    if line is not None and line.startswith("CATEGORY:"):
+        category = line[len("CATEGORY:"):].strip()
+        categories = [c.strip() for c in category.split(',') if c.strip()]
+        line = reader.readline()
+
+    # DATE (optional but expected)
+    if line is not None and line.startswith("DATE:"):
+        date_str = line[len("DATE:"):].strip()
+        try:
+            date = parse_date(date_str)
+        except ValueError:
+            report(source, reader.lineno, f"unparsable DATE {date_str!r}, entry skipped")
+        line = reader.readline()
+    else:
+        report(source, line_start, f"no DATE for {title!r}, entry skipped")
+
+    # Skip to BODY:
+    while line is not None and line != "BODY:" and not _is_entry_delimiter(line) and _glued_title(line) is None:
+        if line.strip() and not _is_section_delimiter(line):
+            report(source, reader.lineno, f"unexpected line before BODY: ignored: {line[:40]!r}")
+        line = reader.readline()
+
+    boundary = None
+    if line == "BODY:":
+        body_span, line, boundary = _read_section(reader)
+        if boundary is None:
+            # consume ----- delimiters after body
+            while line is not None and _is_section_delimiter(line):
+                line = reader.readline()
             # EXTENDED BODY (optional)
-            extended_lines: list[str] = []
-            if idx < len(lines) and lines[idx] == "EXTENDED BODY:":
-                idx += 1
-                while idx < len(lines) and lines[idx] != "-----":
-                    extended_lines.append(lines[idx])
-                    idx += 1
-            
-            # BODYにFINAL_LETTER_TEXT_SECRET  (body_lines)
-            # body_lines に置換をかける
-            body_lines = [line.replace("{{FINAL_LETTER_TEXT_SECRET}}", secret_text) for line in body_lines]
-            
-            entries.append(
-                {
-                    "title": title,
-                    "category": category_line,
-                    "categories": categories,
-                    "date": date,
-                    "date_str": date_str,
-                    "body": "\n".join(body_lines).rstrip(),
-                    "extended": "\n".join(extended_lines).rstrip(),
-                }
-            )
+            if line == "EXTENDED BODY:":
+                extended_span, line, boundary = _read_section(reader)
+
+    if boundary is None:
+        # Anything else up to the next entry is not part of this one
+        while line is not None and not _is_entry_delimiter(line) and _glued_title(line) is None:
+            if line.strip():
+                report(source, reader.lineno, f"text outside BODY / EXTENDED BODY ignored: {line[:40]!r}")
+            line = reader.readline()
+        boundary = reader.lineno if line is not None else reader.lineno + 1
+
+    body_sha1, has_secret, refs = _scan_span(reader.data, body_span, True)
+    extended_sha1, _, extended_refs = _scan_span(reader.data, extended_span, False)
+    asset_refs = tuple(dict.fromkeys(refs + extended_refs))
+    entry = Entry(title, category, categories, date, date_str, source, line_start, boundary - 1,
+                  body_span, extended_span, body_sha1, extended_sha1, has_secret, asset_refs)
+    return entry, line
+
+
+def iter_entries(data, source: str = "<string>", report=report_issue):
+    """Parse :class:`Entry` objects from the bytes of a source file (streaming).
+
+    Entries are separated by a line consisting of ``--------``. Inside BODY
+    and EXTENDED BODY such a line only ends the entry when the next
+    non-blank line is a ``TITLE:``; otherwise it is kept as text. Each
+    entry carries ``source``, ``line_start`` and ``line_end``. Malformed
+    blocks and unparsable DATEs are passed to ``report`` with their line
+    number instead of being dropped silently or aborting the build.
+
+    BODY and EXTENDED BODY are kept as byte spans (``body_span`` /
+    ``extended_span``) plus a digest and are read back on demand.
+    ``has_secret`` marks bodies that contain ``{{FINAL_LETTER_TEXT_SECRET}}``,
+    ``asset_refs`` lists the docs/ images and scripts the entry links to.
+    """
+    reader = SourceReader(data)
+    line = reader.readline()
+    while line is not None:
+        stripped = line.lstrip()
+        if not stripped or _is_entry_delimiter(line):
+            line = reader.readline()
+            continue
+        glued = _glued_title(line)
+        if glued is not None:
+            report(source, reader.lineno, f"TITLE: on the same line as {ENTRY_DELIMITER}, "
+                                          "the previous line probably lacks a newline")
+            stripped = glued
+        elif not stripped.startswith("TITLE:"):
+            report(source, reader.lineno, f"block does not start with TITLE:, skipped: {line[:40]!r}")
+            line = reader.readline()
+            while line is not None and not _is_entry_delimiter(line) and _glued_title(line) is None:
+                line = reader.readline()
+            continue
+        entry, line = _parse_entry(reader, stripped, source, report)
+        yield entry
+
+
+# Memory-mapped source files, opened on first use (per process)
+_source_maps: dict[str, mmap.mmap] = {}
+
+
+def source_map(path: str):
+    data = _source_maps.get(path)
+    if data is None:
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            data = _source_maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return data
+
+
+def parse_file(path: str, report=report_issue) -> list['Entry']:
+    """Parse one source file into entry records (see :func:`iter_entries`)."""
+    data = source_map(path)
+    records = list(iter_entries(data, path, report))
+    if hasattr(data, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'):
+        # The pages are read back from the page cache when a body is needed
+        data.madvise(mmap.MADV_DONTNEED)
+    return records
+
+
+def read_span(path: str, span: tuple[int, int]) -> str:
+    """Decode a BODY / EXTENDED BODY byte span the way the text was written."""
+    if span[0] == span[1]:
+        return ""
+    text = source_map(path)[span[0]:span[1]].decode('utf-8')
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text.rstrip()
+
+
+WEEKDAYS_JA = "月火水木金土日"
+
+
+class Entry:
+    """One blog entry.
+
+    Values the renderers need on every page an entry appears on (year,
+    month, weekday, escaped titles, ...) are computed once here. Only
+    metadata and byte spans are kept in memory: ``body`` and ``extended``
+    are sliced from the memory-mapped source file each time they are read.
+    ``anchor_id`` and ``cat_dirs`` depend on the other entries and on
+    categories.json and are filled in by :func:`prepare_site`.
+    """
+
+    # Parsed fields, in the order of :meth:`record` (what the parse cache stores)
+    RECORD_FIELDS = ('title', 'category', 'categories', 'date', 'date_str', 'source',
+                     'line_start', 'line_end', 'body_span', 'extended_span',
+                     'body_sha1', 'extended_sha1', 'has_secret', 'asset_refs')
+    __slots__ = RECORD_FIELDS + (
+        'year', 'month', 'day', 'iso_date', 'date_text', 'weekday',
+        'title_html', 'title_js', 'anchor_id', 'cat_dirs',
+    )
+
+    def __init__(self, title: str, category: str, categories: list[str], date: datetime | None,
+                 date_str: str, source: str, line_start: int, line_end: int,
+                 body_span: tuple[int, int], extended_span: tuple[int, int],
+                 body_sha1: str, extended_sha1: str, has_secret: bool, asset_refs: tuple[str, ...] = ()):
+        self.title = title
+        self.category = category
+        self.categories = categories
+        self.date = date
+        self.date_str = date_str
+        self.source = source
+        self.line_start = line_start
+        self.line_end = line_end
+        self.body_span = body_span
+        self.extended_span = extended_span
+        self.body_sha1 = body_sha1
+        self.extended_sha1 = extended_sha1
+        self.has_secret = has_secret
+        self.asset_refs = asset_refs
+
+        if date is not None:
+            self.year = f"{date.year:04d}"
+            self.month = f"{date.month:02d}"
+            self.day = f"{date.day:02d}"
+            self.iso_date = f"{self.year}-{self.month}-{self.day}"
+            self.weekday = WEEKDAYS_JA[date.weekday()]
+        else:
+            self.year = self.month = self.day = self.iso_date = self.weekday = ""
+        # The date as written in the source (used in links and ids)
+        self.date_text = date_str.split()[0] if date_str else ""
+        self.title_html = html.escape(title)
+        self.title_js = title.replace("\\", "\\\\").replace("'", "\\'")
+        self.anchor_id = ""
+        self.cat_dirs: list[str] = []
+
+    def record(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.RECORD_FIELDS)
+
+    def __repr__(self):
+        return f"<Entry {self.date_str} {self.title!r} ({self.source}:{self.line_start})>"
+
+    @property
+    def body(self) -> str:
+        body = read_span(self.source, self.body_span)
+        if self.has_secret:
+            # BODYにFINAL_LETTER_TEXT_SECRET を置換 (秘密の本文はキャッシュに書き出さない)
+            body = body.replace(SECRET_PLACEHOLDER, secret_text).rstrip()
+        return body
+
+    @property
+    def extended(self) -> str:
+        return read_span(self.source, self.extended_span)
+
+
+def load_parse_cache(path: str) -> dict:
+    try:
+        with open(path, 'rb') as f:
+            cache = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('version') != PARSE_CACHE_VERSION:
+        return {}
+    return cache.get('files', {})
+
+
+def save_parse_cache(path: str, files: dict):
+    ensure_dir(os.path.dirname(path))
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump({'version': PARSE_CACHE_VERSION, 'files': files}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def parse_entries(source_dir: str = "source_txt", cache_path: str | None = PARSE_CACHE_PATH) -> list[Entry]:
+    """Parse all Markdown sources into a flat list of :class:`Entry`.
+
+    Files whose size and mtime (or, failing that, content hash) match the
+    parse cache are not re-parsed. Pass ``cache_path=None`` to bypass it.
+    """
+    cache = load_parse_cache(cache_path) if cache_path else {}
+    files: dict[str, dict] = {}
+    dirty = False
+    entries = []
+    for path in sorted(glob.glob(os.path.join(source_dir, "*.txt"))):
+        st = os.stat(path)
+        cached = cache.get(path)
+        parsed = None
+        if not (cached and cached['size'] == st.st_size and cached['mtime_ns'] == st.st_mtime_ns):
+            sha1 = file_digest(path)
+            if cached and cached['sha1'] == sha1:
+                records, issues = cached['entries'], cached['issues']
+            else:
+                issues = []
+                parsed = parse_file(path, lambda *issue: issues.append(issue))
+                records = [e.record() for e in parsed]
+            cached = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': sha1,
+                      'entries': records, 'issues': issues}
+            dirty = True
+        files[path] = cached
+        for issue in cached['issues']:
+            report_issue(*issue)
+        entries.extend(parsed if parsed is not None else (Entry(*r) for r in cached['entries']))
+    if cache_path and (dirty or files.keys() != cache.keys()):
+        save_parse_cache(cache_path, files)
     return entries
 
 
@@ -113,10 +536,85 @@ def ensure_dir(path: str):
     os.makedirs(path, exist_ok=True)
 
 
-def write_file(path: str, content: str):
-    ensure_dir(os.path.dirname(path))
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
+class SiteWriter:
+    """Write-if-changed output layer for docs/.
+
+    A file is only rewritten when its bytes differ from what is on disk
+    (size first, then content), so unchanged pages keep their mtime and git
+    sees no change. Changed files are written to a temp file in the same
+    directory and renamed into place.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.written: list[str] = []
+        self.skipped = 0
+        self.bytes_written = 0
+        self.deleted: list[str] = []
+        self.touched: set[str] = set()
+        self._dirs: set[str] = set()
+
+    def write(self, path: str, content: str | bytes) -> bool:
+        """Write ``content`` to ``path`` unless identical. Returns True if written."""
+        data = content.encode('utf-8') if isinstance(content, str) else content
+        self.touched.add(os.path.normpath(path))
+        try:
+            if os.stat(path).st_size == len(data):
+                with open(path, 'rb') as f:
+                    if f.read() == data:
+                        self.skipped += 1
+                        return False
+        except FileNotFoundError:
+            pass
+
+        dir_name = os.path.dirname(path)
+        if dir_name not in self._dirs:
+            ensure_dir(dir_name)
+            self._dirs.add(dir_name)
+        fd, tmp = tempfile.mkstemp(dir=dir_name, prefix='.' + os.path.basename(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.written.append(path)
+        self.bytes_written += len(data)
+        return True
+
+    def record(self, path: str, written: bool):
+        """Account for a file written (or skipped) by another process."""
+        self.touched.add(os.path.normpath(path))
+        if written:
+            self.written.append(path)
+            self.bytes_written += os.path.getsize(path)
+        else:
+            self.skipped += 1
+
+    def keep(self, path: str):
+        """Mark an existing file as part of this build without touching it."""
+        self.touched.add(os.path.normpath(path))
+        self.skipped += 1
+
+    def sweep(self, patterns: list[str]):
+        """Delete files matching ``patterns`` (relative to root) not produced by this build."""
+        for pattern in patterns:
+            for path in sorted(glob.glob(os.path.join(self.root, pattern), recursive=True)):
+                if os.path.normpath(path) in self.touched:
+                    continue
+                os.remove(path)
+                self.deleted.append(path)
+                dir_name = os.path.dirname(path)
+                while dir_name != self.root and not os.listdir(dir_name):
+                    os.rmdir(dir_name)
+                    dir_name = os.path.dirname(dir_name)
+
+    def summary(self) -> str:
+        lines = [f"{len(self.written)} written, {self.skipped} unchanged, {len(self.deleted)} stale deleted"]
+        lines += [f"  deleted: {os.path.relpath(p, self.root)}" for p in self.deleted]
+        return "\n".join(lines)
 
 
 def get_cat_dir(cat: str, mapping: dict[str, str]) -> str:
@@ -131,12 +629,413 @@ def is_running_on_github():
     return os.getenv('GITHUB_ACTIONS') == 'true'
 
 
+# =============================
+# Image sizes
+# =============================
+
+# Intrinsic image sizes, cached by content hash (and file hashes by size and
+# mtime), so a build only reads the headers of new or changed images.
+IMAGE_SIZE_CACHE_PATH = os.path.join('.build_cache', 'image_sizes.json')
+IMAGE_SIZE_CACHE_VERSION = 1
+
+# JPEG start-of-frame markers (all but DHT, JPG and DAC)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_orientation(exif: bytes) -> int:
+    """EXIF orientation tag (1-8) from an APP1 payload, 1 if absent."""
+    if not exif.startswith(b'Exif\0\0') or len(exif) < 14:
+        return 1
+    tiff = exif[6:]
+    order = {b'II': '<', b'MM': '>'}.get(tiff[:2])
+    if order is None:
+        return 1
+    (ifd,) = struct.unpack(order + 'I', tiff[4:8])
+    if ifd + 2 > len(tiff):
+        return 1
+    (count,) = struct.unpack(order + 'H', tiff[ifd:ifd + 2])
+    for i in range(count):
+        pos = ifd + 2 + i * 12
+        if pos + 12 > len(tiff):
+            break
+        tag, _, _, value = struct.unpack(order + 'HHIH', tiff[pos:pos + 10])
+        if tag == 0x0112:
+            return value
+    return 1
+
+
+def _jpeg_size(f) -> tuple[int, int] | None:
+    orientation = 1
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte == b'\xff':  # fill bytes
+            byte = f.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue  # no payload
+        if marker == 0xD9 or marker == 0xDA:
+            return None  # end of image / start of scan before any frame header
+        head = f.read(2)
+        if len(head) < 2:
+            return None
+        (length,) = struct.unpack('>H', head)
+        if marker in _JPEG_SOF:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height, width = struct.unpack('>xHH', data)
+            # Orientations 5-8 are rotated by 90°; browsers apply EXIF rotation
+            return (height, width) if orientation >= 5 else (width, height)
+        if marker == 0xE1 and orientation == 1:
+            orientation = _jpeg_orientation(f.read(length - 2))
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+
+
+def read_image_size(path: str) -> tuple[int, int] | None:
+    """(width, height) from a JPEG, PNG or GIF header, or None if unknown."""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(26)
+            if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+                return struct.unpack('>II', head[16:24])
+            if head[:6] in (b'GIF87a', b'GIF89a'):
+                return struct.unpack('<HH', head[6:10])
+            if head.startswith(b'\xff\xd8'):
+                return _jpeg_size(f)
+    except (OSError, struct.error):
+        pass
+    return None
+
+
+class ImageSizes:
+    """Intrinsic sizes of the images entries link to, by docs/-relative path."""
+
+    def __init__(self, cache_path: str | None = IMAGE_SIZE_CACHE_PATH):
+        self.cache_path = cache_path
+        cache = {}
+        if cache_path:
+            try:
+                with open(cache_path, encoding='utf-8') as f:
+                    cache = json.load(f)
+            except (FileNotFoundError, ValueError):
+                pass
+            if not isinstance(cache, dict) or cache.get('version') != IMAGE_SIZE_CACHE_VERSION:
+                cache = {}
+        self._files: dict[str, list] = cache.get('files', {})   # path -> [size, mtime_ns, sha1]
+        self._by_hash: dict[str, list | None] = cache.get('sizes', {})  # sha1 -> [w, h]
+        self.sizes: dict[str, tuple[int, int]] = {}
+        self.sources: dict[str, tuple[str, str]] = {}  # ref -> (file, sha1)
+        self._dirty = False
+
+    def load(self, refs, root: str = 'docs') -> dict[str, tuple[int, int]]:
+        """Look up the size of every image in ``refs``."""
+        files = {}
+        for ref in refs:
+            if ref in self.sizes or not ref.startswith('image/'):
+                continue
+            path = locate_asset(ref, root)
+            if path is None:
+                continue
+            st = os.stat(path)
+            known = self._files.get(path)
+            if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+                sha1 = known[2]
+            else:
+                sha1 = file_digest(path)
+                self._dirty = True
+            files[path] = [st.st_size, st.st_mtime_ns, sha1]
+            self.sources[ref] = (path, sha1)
+            if sha1 not in self._by_hash:
+                size = read_image_size(path)
+                self._by_hash[sha1] = list(size) if size else None
+                self._dirty = True
+            if self._by_hash[sha1]:
+                self.sizes[ref] = tuple(self._by_hash[sha1])
+        if files.keys() != self._files.keys():
+            self._dirty = True
+        self._files = files
+        return self.sizes
+
+    def save(self):
+        if not (self.cache_path and self._dirty):
+            return
+        live = {v[2] for v in self._files.values()}
+        ensure_dir(os.path.dirname(self.cache_path))
+        tmp = self.cache_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': IMAGE_SIZE_CACHE_VERSION, 'files': self._files,
+                       'sizes': {k: v for k, v in self._by_hash.items() if k in live}}, f)
+        os.replace(tmp, self.cache_path)
+        self._dirty = False
+
+
+IMG_TAG_RE = re.compile(r"<img\b[^>]*>", re.IGNORECASE)
+IMG_ATTR_RE = re.compile(r"""\b(src|srcset|sizes|width|height|style|loading|decoding)\s*=\s*("[^"]*"|'[^']*'|[^\s"'>]+)""",
+                         re.IGNORECASE)
+_PX_RE = re.compile(r"^(\d+)(?:px)?$")
+_MAX_WIDTH_RE = re.compile(r"max-width\s*:\s*(\d+)px", re.IGNORECASE)
+_STYLE_SIZE_RE = re.compile(r"(?<![-\w])(?:width|height)\s*:", re.IGNORECASE)
+_STYLE_PX_RE = re.compile(r"(?<![-\w])(width|height)\s*:\s*(\d+)px", re.IGNORECASE)
+# A written width/height pair whose ratio is further off the image's than
+# this (and by more than 1px) draws it distorted; the height is corrected
+IMG_RATIO_TOLERANCE = 0.02
+
+
+def _img_attrs(tag: str) -> dict[str, str]:
+    """The attributes of an <img> tag :func:`size_img_tag` cares about (first wins)."""
+    attrs: dict[str, re.Match] = {}
+    for m in IMG_ATTR_RE.finditer(tag):
+        attrs.setdefault(m.group(1).lower(), m)
+    return attrs
+
+
+def _img_value(attrs: dict[str, re.Match], name: str) -> str | None:
+    m = attrs.get(name)
+    return m.group(2).strip('"\'').strip() if m else None
+
+
+def img_box(attrs: dict[str, re.Match], size: tuple[int, int] | None) -> tuple[tuple[int, int] | None, int | None]:
+    """Dimensions to write into an <img> tag (None to keep it as is) and the
+    width it is drawn at, if that is known (see :func:`size_img_tag`)."""
+    if not (size and size[0] and size[1]):
+        return None, None
+    iw, ih = size
+    style = _img_value(attrs, 'style') or ''
+    width, height = _img_value(attrs, 'width'), _img_value(attrs, 'height')
+    max_width = _MAX_WIDTH_RE.search(style)
+    if _STYLE_SIZE_RE.search(style):
+        # The style decides the box; only px sizes tell how wide it is
+        box = {k.lower(): int(v) for k, v in _STYLE_PX_RE.findall(style)}
+        if not box or len(box) != len(_STYLE_SIZE_RE.findall(style)):
+            return None, None
+        w = box.get('width') or round(box['height'] * iw / ih)
+        return None, min(w, int(max_width.group(1))) if max_width else w
+    if not all(v is None or _PX_RE.match(v) for v in (width, height)):
+        return None, None
+    if width is not None:
+        w = int(_PX_RE.match(width).group(1))
+        h = round(w * ih / iw)
+        if height is not None and abs(int(_PX_RE.match(height).group(1)) - h) <= max(1, h * IMG_RATIO_TOLERANCE):
+            return None, min(w, int(max_width.group(1))) if max_width else w
+    elif height is not None:
+        h = int(_PX_RE.match(height).group(1))
+        w = round(h * iw / ih)
+    else:
+        w, h = iw, ih
+    if max_width:
+        w = min(w, int(max_width.group(1)))
+    return (w, h), w
+
+
+def _srcset_allowed(attrs: dict[str, re.Match]) -> bool:
+    src = _img_value(attrs, 'src') or ''
+    return 'srcset' not in attrs and not any(c in src for c in ' ,')
+
+
+def size_img_tag(tag: str, image_sizes: dict[str, tuple[int, int]],
+                 thumbnails: dict[str, list[tuple[int, str]]] | None = None) -> str:
+    """Fill in a missing width or height on one <img> tag and make it lazy/async.
+
+    Most entries only give a height; the width is derived from the image's
+    aspect ratio (and capped by a ``max-width`` in the style, which is the
+    box browsers draw), so the space is reserved before the image arrives.
+    Without either attribute the intrinsic size is used. When both are
+    given but their ratio is off the image's (beyond
+    :data:`IMG_RATIO_TOLERANCE`), the height is corrected from the width.
+    Tags whose style sets width/height, with a percentage size, or whose
+    image is unknown keep their dimensions.
+
+    Images with ``thumbnails`` (see :func:`build_thumbnails`) get a
+    ``srcset`` of the downscaled copies plus the original, and ``src``
+    points to the smallest copy at least as wide as the box (which may
+    come from a width/height in px in the style).
+    """
+    attrs = _img_attrs(tag)
+    replace: dict[str, str] = {}
+    src = _img_value(attrs, 'src') or ''
+    ref = asset_path(src) or ''
+    size = image_sizes.get(ref)
+    dims, box_width = img_box(attrs, size)
+    if dims:
+        replace['width'] = f'width="{dims[0]}"'
+        replace['height'] = f'height="{dims[1]}"'
+    variants = thumbnails.get(ref) if thumbnails and box_width else None
+    if variants and _srcset_allowed(attrs):
+        urls = [(tw, posixpath.relpath(path, _ENTRY_PAGE_DIR)) for tw, path in variants]
+        best = next((url for tw, url in urls if tw >= box_width), src)
+        replace['src'] = f'src="{best}"'
+        replace['srcset'] = 'srcset="' + ", ".join(f"{url} {tw}w" for tw, url in urls) + f', {src} {size[0]}w"'
+        replace['sizes'] = f'sizes="{box_width}px"'
+    if 'loading' not in attrs:
+        replace['loading'] = 'loading="lazy"'
+    if 'decoding' not in attrs:
+        replace['decoding'] = 'decoding="async"'
+    if not replace:
+        return tag
+
+    out = []
+    pos = 0
+    for name, m in sorted(attrs.items(), key=lambda item: item[1].start()):
+        if name in replace:
+            out.append(tag[pos:m.start()])
+            out.append(replace.pop(name))
+            pos = m.end()
+    end = len(tag) - 2 if tag.endswith('/>') else len(tag) - 1
+    rest = tag[pos:end].rstrip()
+    added = "".join(" " + replace[name] for name in ('width', 'height', 'srcset', 'sizes', 'loading', 'decoding')
+                    if name in replace)
+    return "".join(out) + rest + added + tag[end:]
+
+
+def size_images(body: str, image_sizes: dict[str, tuple[int, int]],
+                thumbnails: dict[str, list[tuple[int, str]]] | None = None) -> str:
+    """Apply :func:`size_img_tag` to every <img> in an entry body."""
+    if '<img' not in body and '<IMG' not in body and '<Img' not in body:
+        return body
+    return IMG_TAG_RE.sub(lambda m: size_img_tag(m.group(0), image_sizes, thumbnails), body)
+
+
+# =============================
+# Thumbnails
+# =============================
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: without Pillow the pages keep linking the full images
+    Image = ImageOps = None
+
+# Downscaled copies of wide images live in docs/thumbs/, named after the
+# source hash: a replaced image gets new names, existing copies are reused.
+THUMBNAIL_DIR = 'thumbs'
+# Widths offered in srcset (those narrower than the image itself)
+THUMBNAIL_WIDTHS = (320, 640, 960)
+# Default for --thumbnails: images up to this width are used as they are
+THUMBNAIL_MIN_WIDTH = 640
+# GIFs are left alone (many are animations)
+THUMBNAIL_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG'}
+THUMBNAIL_JPEG_QUALITY = 82
+
+
+def thumbnail_path(ref: str, sha1: str, width: int) -> str:
+    """docs/-relative path of the ``width`` px copy of image ``ref``."""
+    stem, ext = posixpath.splitext(ref.split('/', 1)[1])
+    return f"{THUMBNAIL_DIR}/{stem}.{sha1[:10]}.{width}w{ext.lower()}"
+
+
+def make_thumbnail(src: str, dst: str, width: int) -> int:
+    """Write ``src`` scaled down to ``width`` px to ``dst``; returns its size in bytes."""
+    with Image.open(src) as im:
+        # Let the JPEG decoder downscale by 1/2..1/8 while staying wider than
+        # needed (either side may become the width after EXIF rotation)
+        im.draft('RGB', (width, width))
+        fmt = THUMBNAIL_FORMATS[os.path.splitext(src)[1].lower()]
+        # Flat PNGs (screenshots, pixel art) compress far better than their
+        # resampled copies unless those go back to a palette
+        flat = fmt == 'PNG' and im.getcolors(256) is not None
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ('RGB', 'RGBA', 'L'):
+            im = im.convert('RGBA' if im.has_transparency_data else 'RGB')
+        height = max(1, round(im.height * width / im.width))
+        im = im.resize((width, height), Image.LANCZOS)
+        options = {}  # PNG optimize=True is ~10x slower for a few percent
+        if flat:
+            im = im.quantize(256, method=Image.Quantize.FASTOCTREE if im.mode == 'RGBA' else None)
+        elif fmt == 'JPEG':
+            options = {'quality': THUMBNAIL_JPEG_QUALITY, 'optimize': True, 'progressive': True}
+        dir_name = os.path.dirname(dst)
+        ensure_dir(dir_name)
+        fd, tmp = tempfile.mkstemp(dir=dir_name, prefix='.' + os.path.basename(dst), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                im.save(f, fmt, **options)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, dst)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+    return os.path.getsize(dst)
+
+
+def _make_thumbnail_job(job: tuple[str, str, int]) -> int:
+    return make_thumbnail(*job)
+
+
+def srcset_candidates(entries: list[Entry], image_sizes: dict[str, tuple[int, int]]) -> set[str]:
+    """Images shown by an <img> whose drawn width is known, i.e. those a
+    srcset can be given to (many wide ``_big`` images are only linked)."""
+    refs = set()
+    for e in entries:
+        if not any(ref in image_sizes for ref in e.asset_refs):
+            continue
+        for text in (e.body, e.extended):
+            for m in IMG_TAG_RE.finditer(text):
+                attrs = _img_attrs(m.group(0))
+                ref = asset_path(_img_value(attrs, 'src') or '')
+                if ref in image_sizes and _srcset_allowed(attrs) and img_box(attrs, image_sizes[ref])[1]:
+                    refs.add(ref)
+    return refs
+
+
+def build_thumbnails(image_sizes: ImageSizes, refs: set[str], writer: SiteWriter,
+                     min_width: int = THUMBNAIL_MIN_WIDTH, jobs: int = 1,
+                     root: str = 'docs') -> dict[str, list[tuple[int, str]]]:
+    """Make the srcset copies of the images in ``refs`` wider than ``min_width``.
+
+    Returns ``{image ref: [(width, docs/-relative path), ...]}``, narrowest
+    first. Only copies that do not exist yet are made (in ``jobs``
+    processes); copies that come out no smaller than the original are kept
+    on disk but not offered. Returns {} when Pillow is not installed.
+    """
+    if Image is None:
+        print("Pillow is not installed; thumbnails skipped (pip install pillow)")
+        return {}
+    planned: dict[str, list[tuple[int, str]]] = {}
+    todo = []
+    for ref in sorted(refs):
+        src, sha1 = image_sizes.sources[ref]
+        size = image_sizes.sizes[ref]
+        if size[0] <= min_width or os.path.splitext(ref)[1].lower() not in THUMBNAIL_FORMATS:
+            continue
+        for width in THUMBNAIL_WIDTHS:
+            if width * 10 > size[0] * 9:  # less than 10% narrower: not worth a copy
+                break
+            rel = thumbnail_path(ref, sha1, width)
+            path = os.path.join(root, rel)
+            planned.setdefault(ref, []).append((width, rel))
+            if os.path.exists(path):
+                writer.keep(path)
+            else:
+                todo.append((src, path, width))
+
+    if jobs > 1 and len(todo) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            list(pool.map(_make_thumbnail_job, todo, chunksize=max(1, len(todo) // (jobs * 4))))
+    else:
+        for job in todo:
+            make_thumbnail(*job)
+    for _, path, _ in todo:
+        writer.record(path, True)
+
+    thumbnails = {}
+    for ref, variants in planned.items():
+        limit = os.path.getsize(image_sizes.sources[ref][0])
+        usable = [(w, rel) for w, rel in variants if os.path.getsize(os.path.join(root, rel)) < limit]
+        if usable:
+            thumbnails[ref] = usable
+    return thumbnails
+
+
 # =============================
 # HTML fragments
 # =============================
 
-STYLE_BLOCK = """
-<style type='text/css'>
+# STYLE_BLOCK and SCRIPT_BLOCK are published as docs/js/blog.<hash>.css/.js
+# (see shared_assets) so browsers fetch them once for all pages.
+STYLE_BLOCK = """\
 .linkbutton{
   font-size: 0.9em;
   padding: 1px 6px;
@@ -172,15 +1071,30 @@ STYLE_BLOCK = """
 .article_end_date{
   font-size:0.9em;
 }
-</style>
 """
 
-SCRIPT_BLOCK = """
-<script>
+SCRIPT_BLOCK = """\
 function toggle(id){
   const el = document.getElementById(id);
-  if(!el) return;
+  if(!el) return false;
+  const src = el.dataset.src;
+  if(src && !el.dataset.loaded){
+    // 追記は別ファイル (--lazy-extended): 初めて開いたときに読み込んで差し込む
+    el.dataset.loaded = 'loading';
+    fetch(src).then(r=>{ if(!r.ok) throw new Error(r.status); return r.text(); })
+      .then(text=>{
+        const doc = new DOMParser().parseFromString(text, 'text/html');
+        const part = doc.querySelector('.extended');
+        el.innerHTML = part ? part.innerHTML : doc.body.innerHTML;
+        el.dataset.loaded = 'yes';
+        el.style.display = 'block';
+      })
+      .catch(()=>{ location.href = src; });
+    return false;
+  }
+  if(el.dataset.loaded === 'loading') return false;
   el.style.display = (el.style.display === 'none') ? 'block' : 'none';
+  return false;
 }
 
 // Year accordion with sessionStorage persistence
@@ -195,7 +1109,7 @@ function toggleYear(id){
   sessionStorage.setItem('year-'+id, isClosed ? 'open' : 'closed');
 }
 
-window.addEventListener('DOMContentLoaded', ()=>{
+function initYearPanes(){
   document.querySelectorAll('[data-yearpane]').forEach(pane=>{
     const id    = pane.id;
     const state = sessionStorage.getItem('year-'+id);
@@ -209,10 +1123,35 @@ window.addEventListener('DOMContentLoaded', ()=>{
       if(sym) sym.textContent = '＋';
     }
   });
-});
-
-function copyLink(date, title, el){
-  const url = `https://smokingwolf.github.io/dev_blog/archive/${date.slice(0,4)}/${date.slice(5,7)}.html#${date}`;
+}
+window.addEventListener('DOMContentLoaded', initYearPanes);
+
+// サイドバー (--shared-sidebar / --top-shell): ページには上部のリンクだけがあり、
+// 残りを data-src のファイルから読み込んで差し替える。読み込めなければリンクだけのまま
+(function(){
+  const sidebar = document.querySelector('#sidebar[data-src]');
+  if(!sidebar) return;
+  // 共通のサイドバーはファイル名が変わらないので、毎回更新を確認する (変わっていなければ 304)
+  fetch(sidebar.dataset.src, {cache: 'no-cache'})
+    .then(r=>{ if(!r.ok) throw new Error(r.status); return r.text().then(text=>[text, r.url]); })
+    .then(([text, url])=>{
+      const full = new DOMParser().parseFromString(text, 'text/html').getElementById('sidebar');
+      if(!full) return;
+      // サイドバーのファイルからの相対リンクを、このページから辿れるURLに直す
+      full.querySelectorAll('a[href]').forEach(a=>{
+        const href = a.getAttribute('href');
+        if(!href.startsWith('javascript:')) a.href = new URL(href, url).href;
+      });
+      sidebar.replaceWith(document.importNode(full, true));
+      initYearPanes();
+    })
+    .catch(()=>{});
+})();
+
+function copyLink(date, title, el, path){
+  // path: 記事単体ページ (--permalinks) のdocs/からの相対パス。なければ月別ページの該当記事
+  const base = 'https://smokingwolf.github.io/dev_blog/';
+  const url = path ? base + path : `${base}archive/${date.slice(0,4)}/${date.slice(5,7)}.html#${date}`;
   const text = `\n【${date}\u3000${title}】\n ${url}`;
   navigator.clipboard.writeText(text).then(()=>{
     if(el && el.tagName === 'BUTTON'){
@@ -247,9 +1186,320 @@ function copyLink(date, title, el){
     setTimeout(()=>{ popup.remove(); }, 2500);
   });
 }
-</script>
 """
 
+# Scroll position persistence of the master index (docs/index.html)
+INDEX_SCROLL_SCRIPT = (
+  "// 1. 自動スクロール復元をオフ\n"
+  "if ('scrollRestoration' in history) {\n"
+  "history.scrollRestoration = 'manual';\n"
+  "}\n"
+  "// 2. 保存・復元ロジック\n"
+  "const KEY = 'index-scroll';\n"
+  "const saveScroll = () => {\n"
+  "sessionStorage.setItem(KEY, window.pageYOffset);\n"
+  "};\n"
+  "const restoreScroll = () => {\n"
+  "const p = sessionStorage.getItem(KEY);\n"
+  "if (p !== null) {\n"
+  "window.scrollTo(0, parseInt(p, 10));\n"
+  "}\n"
+  "};\n"
+  "// 3. 保存は pagehide で\n"
+  "window.addEventListener('pagehide', saveScroll);\n"
+  "// 4. 復元は load と pageshow で\n"
+  "window.addEventListener('load', restoreScroll);\n"
+  "window.addEventListener('pageshow', restoreScroll);\n"
+)
+
+# Search page (--search, archive/search/index.html). Reads docs/search/index.json,
+# then the year shards newest first until enough entries are found; see
+# build_search_shard for the format. fold() must match search_text().
+SEARCH_SCRIPT = """\
+(function(){
+  const form = document.getElementById('search-form');
+  if(!form) return;
+  const base = form.dataset.base;
+  const status = document.getElementById('search-status');
+  const list = document.getElementById('search-results');
+  const PAGE = 50;
+  const WEEK = '日月火水木金土';
+  const shards = {};
+  let meta = null, run = 0;
+
+  // 全角英数→半角、全角スペース・句読点・括弧→空白、小文字化 (build.py の search_text と同じ)
+  function fold(s){
+    return s.replace(/[\\uff01-\\uff5e]/g, c=>String.fromCharCode(c.charCodeAt(0) - 0xfee0))
+            .replace(/[\\u3000-\\u3003\\u3008-\\u3011\\u3014-\\u301f\\u30fb\\u2026\\u2025]/g, ' ')
+            .toLowerCase();
+  }
+
+  function fetchJSON(url, opts){
+    return fetch(url, opts).then(r=>{ if(!r.ok) throw new Error(r.status); return r.json(); });
+  }
+
+  // 年ごとのインデックス: 出現記事の番号列 (差分) が同じ語はまとめて入っている
+  function shard(year, version){
+    if(!shards[year]){
+      shards[year] = fetchJSON(`${base}search/${year}.json?v=${version}`).then(data=>{
+        const terms = new Map();
+        for(const [gaps, words] of data.terms){
+          let id = -1;
+          const ids = gaps.split(',').map(g=>(id += +g));
+          for(const w of words.split(' ')) terms.set(w, ids);
+        }
+        return {docs: data.docs, terms};
+      });
+    }
+    return shards[year];
+  }
+
+  function intersect(a, b){
+    const out = [];
+    for(let i = 0, j = 0; i < a.length && j < b.length;){
+      if(a[i] < b[j]) i++;
+      else if(a[i] > b[j]) j++;
+      else { out.push(a[i]); i++; j++; }
+    }
+    return out;
+  }
+
+  // 2文字以上の語は bigram の積集合、1文字の語はその文字を含む bigram の和集合
+  function lookup(sh, word){
+    const cs = Array.from(word);
+    if(cs.length === 1){
+      const ids = new Set();
+      for(const [w, p] of sh.terms) if(w.startsWith(word) || w.endsWith(word)) p.forEach(i=>ids.add(i));
+      return [...ids].sort((a, b)=>a - b);
+    }
+    let ids = null;
+    for(let i = 0; i + 1 < cs.length; i++){
+      const p = sh.terms.get(cs[i] + cs[i + 1]);
+      if(!p) return [];
+      ids = ids ? intersect(ids, p) : p;
+      if(!ids.length) break;
+    }
+    return ids;
+  }
+
+  function match(sh, words){
+    let ids = null;
+    for(const w of words){
+      ids = ids ? intersect(ids, lookup(sh, w)) : lookup(sh, w);
+      if(!ids.length) break;
+    }
+    return ids;
+  }
+
+  function item(doc){
+    const [anchor, title, cat] = doc;
+    const y = anchor.slice(0, 4), m = anchor.slice(5, 7);
+    const wd = WEEK[new Date(+y, +m - 1, +anchor.slice(8, 10)).getDay()];
+    const row = document.createElement('div');
+    const a = document.createElement('a');
+    a.href = `${base}archive/${y}/${m}.html#${anchor}`;
+    a.className = 'blue';
+    a.textContent = `${anchor.slice(0, 10)}(${wd})\\u3000${title}`;
+    row.append('・', a);
+    if(cat){
+      const c = document.createElement('font');
+      c.className = 'top_minicategory';
+      c.textContent = cat;
+      row.append(' ', c);
+    }
+    return row;
+  }
+
+  function show(found){
+    // タイトルに全語を含む記事を先に (それ以外は新しい順のまま)
+    const sorted = found.filter(f=>f.inTitle).concat(found.filter(f=>!f.inTitle));
+    list.replaceChildren(...sorted.map(f=>item(f.doc)));
+  }
+
+  function more(year){
+    return new Promise(resolve=>{
+      const btn = document.createElement('button');
+      btn.type = 'button';
+      btn.textContent = `${year}年以前も検索`;
+      btn.onclick = ()=>{ btn.remove(); resolve(); };
+      status.append(' ', btn);
+    });
+  }
+
+  async function search(q, year){
+    const id = ++run;
+    const words = fold(q).split(/\\s+/).filter(Boolean);
+    list.replaceChildren();
+    if(!words.length){ status.textContent = ''; return; }
+    status.textContent = '検索中…';
+    try{
+      meta = meta || await fetchJSON(`${base}search/index.json`, {cache: 'no-cache'});
+      const years = meta.years.filter(y=>!year || y[0] === year);
+      const found = [];
+      let limit = PAGE;
+      for(let i = 0; i < years.length; i++){
+        const sh = await shard(years[i][0], years[i][2]);
+        if(id !== run) return;
+        for(const n of match(sh, words)){
+          const doc = sh.docs[n];
+          const title = fold(doc[1]);
+          found.push({doc, inTitle: words.every(w=>title.includes(w))});
+        }
+        show(found);
+        const last = years[i][0], first = years[0][0];
+        status.textContent = `${found.length}件（${first === last ? first : last + '〜' + first}年）`;
+        if(found.length >= limit && i + 1 < years.length){
+          await more(years[i + 1][0]);
+          if(id !== run) return;
+          limit = found.length + PAGE;
+        }
+      }
+      if(!found.length) status.textContent = '見つかりませんでした';
+    }catch(e){
+      if(id === run) status.textContent = '検索インデックスを読み込めませんでした';
+    }
+  }
+
+  form.addEventListener('submit', ev=>{
+    ev.preventDefault();
+    const q = form.elements.q.value, year = form.elements.year.value;
+    const params = new URLSearchParams({q});
+    if(year) params.set('year', year);
+    history.replaceState(null, '', '?' + params);
+    search(q, year);
+  });
+
+  const params = new URLSearchParams(location.search);
+  form.elements.q.value = params.get('q') || '';
+  form.elements.year.value = params.get('year') || '';
+  if(form.elements.q.value) search(form.elements.q.value, form.elements.year.value);
+})();
+"""
+
+# Top page shell (--top-shell): fills in the month parts from their
+# content-named files under archive/top/ (see write_top_parts); blog.js
+# loads the sidebar
+TOP_SHELL_SCRIPT = """\
+(function(){
+  // innerHTML では <script> が実行されない (ツイートの埋め込みなど) ので作り直す
+  function activate(root){
+    root.querySelectorAll('script').forEach(old=>{
+      const s = document.createElement('script');
+      for(const a of old.attributes) s.setAttribute(a.name, a.value);
+      s.text = old.text;
+      old.replaceWith(s);
+    });
+  }
+  function fetchText(url){
+    return fetch(url).then(r=>{ if(!r.ok) throw new Error(r.status); return r.text(); });
+  }
+
+  // 月ごとの記事: 読み込めなければ月別ページへのリンクのまま
+  const months = Array.from(document.querySelectorAll('.top-month[data-src]'));
+  Promise.all(months.map(el=>fetchText(el.dataset.src).then(text=>{
+    el.innerHTML = text;
+    activate(el);
+  }))).then(()=>{
+    const id = decodeURIComponent(location.hash.slice(1));
+    const target = id && document.getElementById(id);
+    if(target) target.scrollIntoView();
+  }).catch(()=>{});
+})();
+"""
+
+# Master index with year shards (--sharded-index): loads the title list of
+# a year from archive/<year>/index.html (see write_year_indexes) when it is
+# opened, the newest year right away
+YEAR_INDEX_SCRIPT = """\
+(function(){
+  function load(box){
+    if(box.dataset.loaded) return;
+    box.dataset.loaded = 'loading';
+    fetch(box.dataset.src).then(r=>{ if(!r.ok) throw new Error(r.status); return r.text().then(text=>[text, r.url]); })
+      .then(([text, url])=>{
+        const list = new DOMParser().parseFromString(text, 'text/html').querySelector('.master-year');
+        // 年別ファイルからの相対リンクを、このページから辿れるURLに直す
+        list.querySelectorAll('a[href]').forEach(a=>{ a.href = new URL(a.getAttribute('href'), url).href; });
+        box.replaceChildren(...list.childNodes);
+        box.dataset.loaded = 'yes';
+      })
+      .catch(()=>{ delete box.dataset.loaded; });
+  }
+  function loadHash(){
+    const box = document.querySelector(`.master-year[data-year="${location.hash.slice(1)}"]`);
+    if(box) load(box);
+  }
+  const boxes = document.querySelectorAll('.master-year[data-src]');
+  boxes.forEach(box=>{
+    const link = box.querySelector('a');
+    if(link) link.addEventListener('click', ev=>{ ev.preventDefault(); load(box); });
+  });
+  if(boxes.length) load(boxes[0]);
+  loadHash();
+  window.addEventListener('hashchange', loadHash);
+})();
+"""
+
+# Generated files under docs/js/ (docs/-relative globs): the blocks above,
+# named after their content. Old versions are swept like stale pages, and
+# sync_assets.py leaves them alone.
+SHARED_ASSET_DIR = 'js'
+GENERATED_ASSETS = [f'{SHARED_ASSET_DIR}/blog.*.css', f'{SHARED_ASSET_DIR}/blog.*.js',
+                    f'{SHARED_ASSET_DIR}/index-scroll.*.js', f'{SHARED_ASSET_DIR}/search.*.js',
+                    f'{SHARED_ASSET_DIR}/top-shell.*.js', f'{SHARED_ASSET_DIR}/year-index.*.js']
+
+
+def shared_assets(search: bool = False, top_shell: bool = False,
+                  sharded_index: bool = False) -> dict[str, tuple[str, str]]:
+    """``{name: (docs/-relative path, content)}`` of the shared CSS/JS files.
+
+    The path carries a digest of the content, so a file never changes once
+    published and can be cached indefinitely; a new version gets a new URL.
+    The scripts of the search page, the top page shell and the sharded
+    master index are only included with ``search``, ``top_shell`` and
+    ``sharded_index``.
+    """
+    assets = {}
+    files = [('blog.css', STYLE_BLOCK), ('blog.js', SCRIPT_BLOCK), ('index-scroll.js', INDEX_SCROLL_SCRIPT)]
+    if search:
+        files.append(('search.js', SEARCH_SCRIPT))
+    if top_shell:
+        files.append(('top-shell.js', TOP_SHELL_SCRIPT))
+    if sharded_index:
+        files.append(('year-index.js', YEAR_INDEX_SCRIPT))
+    for name, content in files:
+        stem, ext = os.path.splitext(name)
+        fingerprint = hashlib.sha1(content.encode('utf-8')).hexdigest()[:10]
+        assets[name] = (f"{SHARED_ASSET_DIR}/{stem}.{fingerprint}{ext}", content)
+    return assets
+
+
+_TEMPLATE_URL_RE = re.compile(r"""(\b(?:src|href)\s*=\s*)(["'])([^"']*)\2""", re.IGNORECASE)
+
+
+def asset_versions(templates: dict[str, str], root: str = 'docs') -> dict[str, str]:
+    """Content digests of the js/ files (source_js/) the templates link to."""
+    versions = {}
+    for text in templates.values():
+        for m in _TEMPLATE_URL_RE.finditer(text):
+            ref = asset_path(m.group(3))
+            if ref and ref.startswith('js/') and ref not in versions:
+                path = locate_asset(ref, root)
+                if path:
+                    versions[ref] = file_digest(path)[:10]
+    return versions
+
+
+def version_asset_urls(text: str, versions: dict[str, str]) -> str:
+    """Append ``?v=<digest>`` to the js/ URLs in a template, so an updated
+    script or stylesheet in source_js/ is not served from a stale cache."""
+    def repl(m):
+        ref = asset_path(m.group(3))
+        if ref not in versions or '?' in m.group(3):
+            return m.group(0)
+        return f"{m.group(1)}{m.group(2)}{m.group(3)}?v={versions[ref]}{m.group(2)}"
+    return _TEMPLATE_URL_RE.sub(repl, text)
+
 # Meta tags to prevent caching, inserted only for the top index page
 NO_CACHE_META = """
 <meta http-equiv="Cache-Control" content="no-cache, no-store, must-revalidate">
@@ -257,54 +1507,104 @@ NO_CACHE_META = """
 <meta http-equiv="Expires" content="0">
 """
 
+# EXTENDED BODY files written with --lazy-extended
+EXTENDED_DIR = 'extended'
+
+# One page per entry written with --permalinks
+PERMALINK_DIR = 'entry'
+
 # Precompiled regex for locating the opening <head> tag
 HEAD_OPEN_RE = re.compile(r"(<head[^>]*>)", re.IGNORECASE)
 
 
-def render_entry_block(entry: dict, anchor_id: str, next_anchor: str | None,
-                       page_dir: str, root: str = 'docs'):
-    """Return HTML snippet for a single entry, including optional extended part.
+def extended_id(entry: Entry) -> str:
+    """Element id of an entry's EXTENDED BODY."""
+    # Content-derived id: Python's hash() is salted per process, which
+    # made every rebuild rewrite all pages with an extended body.
+    return f"ext-{hashlib.sha1((entry.date_text + entry.title).encode('utf-8')).hexdigest()[:16]}"
 
-    ``anchor_id`` is the id assigned to this entry and ``next_anchor`` should be
-    the id of the next entry (or ``None``). A link with a ▼ symbol pointing to
-    ``next_anchor`` will be placed on the right side of the title bar.
+
+def extended_path(entry: Entry) -> str:
+    """docs/-relative path of an entry's EXTENDED BODY file (--lazy-extended).
+
+    Two levels deep like the pages showing it, so the relative image links
+    of the text work both inside the page and when the file is opened alone.
+    """
+    return f"{EXTENDED_DIR}/{entry.year}/{extended_id(entry)}.html"
+
+
+def permalink_path(entry: Entry) -> str:
+    """docs/-relative path of an entry's own page (--permalinks).
+
+    Two levels deep like the archive, so the relative links in the entry
+    body work unchanged. The anchor is unique across the site.
+    """
+    return f"{PERMALINK_DIR}/{entry.year}/{entry.anchor_id}.html"
+
+
+def render_extended_file(entry: Entry, image_sizes: dict[str, tuple[int, int]] | None = None,
+                         thumbnails: dict[str, list[tuple[int, str]]] | None = None) -> str:
+    """Standalone page holding an entry's EXTENDED BODY (``.extended`` is
+    what toggle() takes out of it); also the link target without JS."""
+    extended = size_images(entry.extended, image_sizes or {}, thumbnails).replace("\n", "<br>")
+    page = posixpath.relpath(f"archive/{entry.year}/{entry.month}.html", posixpath.dirname(extended_path(entry)))
+    return (
+        "<!DOCTYPE html>\n"
+        "<html lang=\"ja\"><head><meta charset=\"utf-8\"><meta name=\"robots\" content=\"noindex\">"
+        f"<title>{entry.title_html}（追記）</title></head><body>\n"
+        f"<div class=\"extended\">{extended}</div>\n"
+        f"<p><a href=\"{page}#{entry.anchor_id}\">記事に戻る</a></p>\n"
+        "</body></html>\n"
+    )
+
+
+def render_entry_parts(entry: Entry, anchor_id: str,
+                       image_sizes: dict[str, tuple[int, int]] | None = None,
+                       thumbnails: dict[str, list[tuple[int, str]]] | None = None,
+                       lazy_extended: bool = False, permalinks: bool = False) -> tuple[str, str, str]:
+    """Return the position-independent parts of an entry block.
+
+    The block is ``head + arrow + middle + category links + tail``; only the
+    ▼ arrow (next entry) and the relative category links depend on where the
+    entry is shown, see :func:`render_entry_block`. <img> tags get their
+    width/height from ``image_sizes`` and a srcset from ``thumbnails``
+    (see :func:`size_img_tag`). With ``lazy_extended`` the EXTENDED BODY
+    is left out and loaded from its own file (:func:`render_extended_file`)
+    when opened. With ``permalinks`` the link buttons copy the URL of the
+    entry's own page (:func:`permalink_path`) instead of its month page.
     """
-    title_raw = entry["title"]
-    title_html_safe = html.escape(title_raw)
-    date_str = entry["date_str"].split()[0]
-    weekday = "月火水木金土日"[entry["date"].weekday()]
-    date_disp = f"{date_str} ({weekday})"
-    body = entry["body"].replace("\n", "<br>")
-    extended = entry["extended"].replace("\n", "<br>")
-    title_js = title_raw.replace("\\", "\\\\").replace("'", "\\'")
+    image_sizes = image_sizes or {}
+    title_raw = entry.title
+    title_html_safe = entry.title_html
+    date_str = entry.date_text
+    date_disp = f"{date_str} ({entry.weekday})"
+    body = size_images(entry.body, image_sizes, thumbnails).replace("\n", "<br>")
+    extended_raw = entry.extended
+    title_js = entry.title_js
+    copy_args = f"'{date_str}','{title_js}', this"
+    if permalinks:
+        copy_args += f", '{permalink_path(entry)}'"
 
     ext_html = ""
-    if entry["extended"]:
-        ext_id = f"ext-{hash(date_str + title_raw)}"
+    if extended_raw and lazy_extended:
+        ext_id = extended_id(entry)
+        url = posixpath.relpath(extended_path(entry), _ENTRY_PAGE_DIR)
+        ext_html = (
+            f'<CENTER>　<a href="{url}" onclick="return toggle(\'{ext_id}\')">&#9660;追記を開く&#9660;</a></CENTER>'
+            f'<div id="{ext_id}" style="display:none;" class="extended" data-src="{url}"></div>'
+        )
+    elif extended_raw:
+        ext_id = extended_id(entry)
+        extended = size_images(extended_raw, image_sizes, thumbnails).replace("\n", "<br>")
         ext_html = (
             f'<CENTER>　<a href="javascript:void(0);" onclick="toggle(\'{ext_id}\')">&#9660;追記を開く&#9660;</a></CENTER>'
             f'<div id="{ext_id}" style="display:none;" class="extended">{extended}</div>'
         )
 
-    if next_anchor:
-        arrow = (
-            f"<span style='float:right;'>"
-            f"<a href='#{next_anchor}' class='jumplink' title='次の記事へ'>▼</a>"
-            f"</span>"
-        )
-    else:
-        arrow = ""
-
-    title_html = (
-        f"■"
-        f"<span onclick=\"copyLink('{date_str}','{title_js}', this)\" style='cursor:pointer;'>"
-        f"{date_disp}&nbsp;&nbsp;&nbsp;{title_html_safe}</span>{arrow}"
-    )
-
     year, month, _ = date_str.split('-')
     link = f"https://smokingwolf.github.io/dev_blog/archive/{year}/{month}.html#{anchor_id}"
     enc_url = urllib.parse.quote(link, safe='')
-    enc_title = urllib.parse.quote(entry['title'], safe='')
+    enc_title = urllib.parse.quote(title_raw, safe='')
     if is_running_on_github():
         clap_html = (
             f"<a href=\"//clap.fc2.com/post/smokingwolf/?url={enc_url}&title={enc_title}\" target=\"_blank\" title=\"web拍手 by FC2\">"
@@ -312,47 +1612,227 @@ def render_entry_block(entry: dict, anchor_id: str, next_anchor: str | None,
         )
     else:
         clap_html = "(Local)"
-    cat_html = ""
-    categories: list[str] = entry.get("categories") or []
-    cat_dirs: list[str] = entry.get("cat_dirs") or []
-    if categories and page_dir:
-        rel_root = os.path.relpath(root, page_dir)
-        links = []
-        for c, d in zip(categories, cat_dirs):
-            link = f"{rel_root}/category/{d}/001.html"
-            links.append(f"<a href='{link}'>{html.escape(c)}</a>")
-        cat_html = f" <span style='float:right;'>カテゴリ: {', '.join(links)}</span>"
-
-    end_html = (
+
+    head = (
+        f"<a id='{anchor_id}'></a><BR><div class='entry'>"
+        f"<div class='entry-title'>■"
+        f"<span onclick=\"copyLink({copy_args})\" style='cursor:pointer;'>"
+        f"{date_disp}&nbsp;&nbsp;&nbsp;{title_html_safe}</span>"
+    )
+    middle = (
+        f"</div>"
+        f"<div class='entry-body'>{body}</div>"
+        f"{ext_html}"
         f"<div class='entry-foot'>"
         f"　<font class='article_end_date'>{date_disp}</font>　"
         f"{clap_html}<span style='display:inline-block;width:15px;'></span>"
-        f" <button class='linkbutton' onclick=\"copyLink('{date_str}','{title_js}', this)\">📋 リンクをコピー</button>"
-        f"{cat_html}"
-        f"</div>"
+        f" <button class='linkbutton' onclick=\"copyLink({copy_args})\">📋 リンクをコピー</button>"
     )
+    tail = "</div></div>"
+    return head, middle, tail
+
 
+def render_entry_arrow(next_anchor: str | None) -> str:
+    """▼ link pointing to ``next_anchor``, placed on the right of the title bar."""
+    if not next_anchor:
+        return ""
     return (
-        f"<a id='{anchor_id}'></a><BR><div class='entry'>"
-        f"<div class='entry-title'>{title_html}</div>"
-        f"<div class='entry-body'>{body}</div>"
-        f"{ext_html}"
-        f"{end_html}</div>"
+        f"<span style='float:right;'>"
+        f"<a href='#{next_anchor}' class='jumplink' title='次の記事へ'>▼</a>"
+        f"</span>"
     )
 
 
+def render_entry_cat_links(entry: Entry, page_dir: str, root: str = 'docs') -> str:
+    """Category links of an entry, relative to ``page_dir``."""
+    categories = entry.categories
+    cat_dirs = entry.cat_dirs
+    if not (categories and page_dir):
+        return ""
+    rel_root = os.path.relpath(root, page_dir)
+    links = []
+    for c, d in zip(categories, cat_dirs):
+        link = f"{rel_root}/category/{d}/001.html"
+        links.append(f"<a href='{link}'>{html.escape(c)}</a>")
+    return f" <span style='float:right;'>カテゴリ: {', '.join(links)}</span>"
+
+
+def render_entry_block(entry: Entry, anchor_id: str, next_anchor: str | None,
+                       page_dir: str, root: str = 'docs',
+                       image_sizes: dict[str, tuple[int, int]] | None = None,
+                       thumbnails: dict[str, list[tuple[int, str]]] | None = None):
+    """Return HTML snippet for a single entry, including optional extended part.
+
+    ``anchor_id`` is the id assigned to this entry and ``next_anchor`` should be
+    the id of the next entry (or ``None``). A link with a ▼ symbol pointing to
+    ``next_anchor`` will be placed on the right side of the title bar.
+    """
+    head, middle, tail = render_entry_parts(entry, anchor_id, image_sizes, thumbnails)
+    return (head + render_entry_arrow(next_anchor) + middle
+            + render_entry_cat_links(entry, page_dir, root) + tail)
+
+
+class EntryFragments:
+    """Memoized entry blocks shared by month, category and top pages.
+
+    The position-independent parts of each entry are rendered once and
+    keyed by the entry digest, anchor and environment, so the store can be
+    persisted between builds: an unchanged entry is never re-rendered, even
+    when the page it sits on has to be regenerated. Category links are
+    cached per relative root; the ▼ arrow is a plain format.
+
+    With a ``cache_path`` the parts live in an SQLite file rather than in
+    memory, so memory use does not grow with the size of the archive; only
+    the most recently used parts are kept around. Entries whose body has
+    the secret substituted (``has_secret``) are only ever kept in memory,
+    like the parse cache the store never holds the secret text.
+
+    ``image_sizes`` maps docs/-relative image paths to their intrinsic size
+    (see :class:`ImageSizes`) and ``thumbnails`` to their srcset copies;
+    both have to be covered by the entry digests. ``lazy_extended`` leaves
+    the EXTENDED BODY out of the blocks, and ``permalinks`` points their
+    link buttons at the entry pages.
+    """
+
+    VERSION = 6
+    MEMO_SIZE = 64
+
+    def __init__(self, cache_path: str | None = None, code_digest: str | None = None,
+                 image_sizes: dict[str, tuple[int, int]] | None = None,
+                 thumbnails: dict[str, list[tuple[int, str]]] | None = None,
+                 lazy_extended: bool = False, permalinks: bool = False):
+        self.cache_path = cache_path
+        self.code_digest = code_digest
+        self.image_sizes = image_sizes or {}
+        self.thumbnails = thumbnails or {}
+        self.lazy_extended = lazy_extended
+        self.permalinks = permalinks
+        self.keys: dict[str, str] = {}
+        self.memo: OrderedDict[str, tuple[str, str, str]] = OrderedDict()
+        self.cat_links: dict[tuple[str, str], str] = {}
+        self.stored: dict[str, tuple[str, str, str]] = {}  # without cache_path, and secret entries
+        self._db: sqlite3.Connection | None = None
+
+    def __getstate__(self):
+        # Worker processes open their own connection
+        state = self.__dict__.copy()
+        state['_db'] = None
+        state['memo'] = OrderedDict()
+        return state
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            ensure_dir(os.path.dirname(self.cache_path))
+            try:
+                self._db = self._open()
+            except sqlite3.DatabaseError:
+                os.remove(self.cache_path)
+                self._db = self._open()
+        return self._db
+
+    def _open(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.cache_path)
+        # Overwrite deleted rows instead of leaving them in free pages
+        db.execute("PRAGMA secure_delete = ON")
+        db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        db.execute("CREATE TABLE IF NOT EXISTS parts (key TEXT PRIMARY KEY, head TEXT, middle TEXT, tail TEXT)")
+        stamp = f"{self.VERSION}:{self.code_digest}"
+        row = db.execute("SELECT value FROM meta WHERE name = 'stamp'").fetchone()
+        if row is None or row[0] != stamp:
+            db.execute("DELETE FROM parts")
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('stamp', ?)", (stamp,))
+            db.commit()
+        return db
+
+    def prepare(self, entries: list[Entry], entry_digests: dict[str, str]):
+        """Render the static parts of every entry not in the store yet."""
+        github = is_running_on_github()
+        for e in entries:
+            anchor = e.anchor_id
+            self.keys[anchor] = digest([entry_digests[anchor], anchor, github, self.lazy_extended, self.permalinks])
+        if not self.cache_path:
+            for e in entries:
+                key = self.keys[e.anchor_id]
+                if key not in self.stored:
+                    self.stored[key] = render_entry_parts(e, e.anchor_id, self.image_sizes, self.thumbnails,
+                                                          self.lazy_extended, self.permalinks)
+            return
+        db = self._connect()
+        known = {row[0] for row in db.execute("SELECT key FROM parts")}
+        for e in entries:
+            key = self.keys[e.anchor_id]
+            if e.has_secret:
+                self.stored[key] = render_entry_parts(e, e.anchor_id, self.image_sizes, self.thumbnails,
+                                                      self.lazy_extended, self.permalinks)
+            elif key not in known:
+                db.execute("INSERT OR REPLACE INTO parts VALUES (?, ?, ?, ?)",
+                           (key, *render_entry_parts(e, e.anchor_id, self.image_sizes, self.thumbnails,
+                                                     self.lazy_extended, self.permalinks)))
+        db.commit()
+
+    def parts(self, entry: Entry) -> tuple[str, str, str]:
+        anchor = entry.anchor_id
+        key = self.keys.get(anchor)
+        parts = self.memo.get(key) if key else None
+        if parts is not None:
+            return parts
+        if key:
+            parts = self.stored.get(key)
+        if parts is None and key and self.cache_path:
+            parts = self._connect().execute(
+                "SELECT head, middle, tail FROM parts WHERE key = ?", (key,)).fetchone()
+        if parts is None:
+            return render_entry_parts(entry, anchor, self.image_sizes, self.thumbnails,
+                                      self.lazy_extended, self.permalinks)
+        self.memo[key] = parts
+        if len(self.memo) > self.MEMO_SIZE:
+            self.memo.popitem(last=False)
+        return parts
+
+    def block(self, entry: Entry, next_anchor: str | None, page_dir: str, root: str = 'docs') -> str:
+        anchor = entry.anchor_id
+        rel_root = os.path.relpath(root, page_dir) if page_dir else ''
+        cat_links = self.cat_links.get((anchor, rel_root))
+        if cat_links is None:
+            cat_links = self.cat_links[(anchor, rel_root)] = render_entry_cat_links(entry, page_dir, root)
+        head, middle, tail = self.parts(entry)
+        return head + render_entry_arrow(next_anchor) + middle + cat_links + tail
+
+    def save(self):
+        """Drop parts of entries not used in this build and close the store."""
+        if self._db is None:
+            return
+        live = set(self.keys.values()) - set(self.stored)
+        stale = [(row[0],) for row in self._db.execute("SELECT key FROM parts") if row[0] not in live]
+        self._db.executemany("DELETE FROM parts WHERE key = ?", stale)
+        self._db.commit()
+        self._db.close()
+        self._db = None
+
+
 # =============================
 # Sidebar
 # =============================
 
+# The full sidebar as a file of its own (--shared-sidebar), docs/-relative.
+# Its name never changes, so pages can link it without being rewritten.
+SHARED_SIDEBAR_PAGE = 'archive/top/sidebar.html'
+
+
 def render_sidebar(all_months: list[tuple[str, str]],
                    cat_counts: dict[str, int],
                    page_dir: str,
                    root: str = 'docs',
                    month_counts: dict[tuple[str, str], int] | None = None,
                    cat_dir_map: dict[str, str] | None = None,
-                   recent_entries: list[dict] | None = None) -> str:
-    """Generate sidebar HTML."""
+                   recent_entries: list[Entry] | None = None,
+                   search: bool = False, compact: bool = False, src: str | None = None) -> str:
+    """Generate sidebar HTML (with a link to the search page if ``search``).
+
+    The ``compact`` sidebar of the entry pages only has the links at the top,
+    not the latest entries, categories and months. With ``src`` blog.js
+    replaces it by the full sidebar loaded from that URL.
+    """
     month_counts = month_counts or {}
     # Prepare relative path root → this page_dir
     rel_root = os.path.relpath(root, page_dir)
@@ -365,22 +1845,23 @@ def render_sidebar(all_months: list[tuple[str, str]],
     years_sorted = sorted(month_by_year.keys(), reverse=True)
 
     lines: list[str] = []
-    lines.append("<div id='sidebar'>")
+    lines.append(f"<div id='sidebar' data-src='{src}'>" if src else "<div id='sidebar'>")
 
     # Heading & top link
     lines.append("<div style='font-weight:bold;'>開発日誌</div>")
     lines.append(f"<div><a class='sidebar_link' href='{rel_root}/archive/top/index.html'>日誌トップへ</a></div>")
     lines.append(f"<div><B><a class='sidebar_link' href='{rel_root}/index.html'>全記事一覧</a></B></div>")
+    if search:
+        lines.append(f"<div><a class='sidebar_link' href='{rel_root}/{SEARCH_PAGE}'>記事検索</a></div>")
+    if compact:
+        lines.append("</div>")  # #sidebar
+        return "\n".join(lines)
     if recent_entries:
         lines.append("<hr>")
         lines.append("<div style='font-weight:bold;'>【最新記事】</div>")
         for ent in recent_entries:
-            y = ent['date'].strftime('%Y')
-            m = ent['date'].strftime('%m')
-            d = ent['date'].strftime('%d')
-            title = html.escape(ent['title'])
-            url = f"{rel_root}/archive/{y}/{m}.html#{ent['anchor_id']}"
-            caption = f"{m}/{d} {title}"
+            url = f"{rel_root}/archive/{ent.year}/{ent.month}.html#{ent.anchor_id}"
+            caption = f"{ent.month}/{ent.day} {ent.title_html}"
             lines.append(f"<div><a class='sidebar_link_recent' href='{url}'>●{caption}</a></div>")
     lines.append("<hr>")
 
@@ -418,345 +1899,1383 @@ def render_sidebar(all_months: list[tuple[str, str]],
 # Full page assembler
 # =============================
 
-def render_body(title: str, content: str, sidebar_html: str, navigation: str,
-                header_in_content: str, footer_end_content: str,
-                article_pos: str = "", article_pos_html: str | None = None) -> str:
-    """Return the HTML to be placed inside <body>."""
-    body_parts = [STYLE_BLOCK, SCRIPT_BLOCK]
-    body_parts.append("<div id='content'>")
-    body_parts.append(header_in_content)
-    body_parts.append("")
-    if article_pos_html is not None:
-        body_parts.append(f"<div class='article_pos'>{article_pos_html}</div>")
-    elif article_pos:
-        body_parts.append(f"<div class='article_pos'>{html.escape(article_pos)}</div>")
-    body_parts.append(f"<div class='nav'>{navigation}</div>")
-    body_parts.append(content)
-    if article_pos_html is not None:
-        body_parts.append(f"<div class='article_pos'>{article_pos_html}</div>")
-    elif article_pos:
-        body_parts.append(f"<div class='article_pos'>{html.escape(article_pos)}</div>")
-    body_parts.append(f"<div class='nav'>{navigation}</div>")
-    body_parts.append("<a id='bottom'></a>")
-    body_parts.append(footer_end_content)
-    body_parts.append("")
-    body_parts.append("</div>")  # #content
-    body_parts.append(sidebar_html)
-    return "\n".join(body_parts)
-
-
-def assemble_full_page(title: str, body_html: str, header_tpl: str, footer_tpl: str) -> str:
-    """Merge header / body / footer. %TITLE% placeholder in header will be replaced."""
-    header = header_tpl.replace("%TITLE%", html.escape(title))
-    return header + body_html + footer_tpl
+class PageLayout:
+    """Pre-split page chrome shared by every page of one build.
+
+    The sidebar only varies with the relative path back to ``root`` and is
+    rendered once per depth; with ``shared_sidebar`` pages only get its top
+    links and load the rest from :data:`SHARED_SIDEBAR_PAGE`. The header/footer templates and the static
+    parts of the body are joined once, so a page is stitched together from a
+    handful of ready-made segments.
+    """
+
+    def __init__(self, site: dict, templates: dict[str, str]):
+        self.site = site
+        self.root = site['root']
+        versions = site.get('asset_versions', {})
+        templates = {k: version_asset_urls(v, versions) for k, v in templates.items()}
+        self.assets = shared_assets(site.get('search', False), site.get('top_shell', False),
+                                    site.get('sharded_index', False))
+        self.header_parts = templates['header'].split('%TITLE%')
+        self.footer = templates['footer']
+        self.body_head = "\n".join([
+            "",
+            f"<link rel='stylesheet' href='../../{self.assets['blog.css'][0]}' type='text/css'>",
+            f"<script src='../../{self.assets['blog.js'][0]}' defer></script>",
+            "<div id='content'>",
+            templates['header_in_content'], ""]) + "\n"
+        self.body_tail = "\n".join(["<a id='bottom'></a>", templates['footer_end_content'], "", "</div>"]) + "\n"
+        self._sidebars: dict[tuple[str, bool], str] = {}
+
+    def sidebar(self, page_dir: str, compact: bool = False) -> str:
+        rel_root = os.path.relpath(self.root, page_dir)
+        sidebar = self._sidebars.get((rel_root, compact))
+        if sidebar is None:
+            if not compact and self.site.get('shared_sidebar'):
+                # Nothing here depends on the other entries, so a new entry
+                # does not change every page (see layout_signature)
+                sidebar = render_sidebar([], {}, page_dir, self.root, search=self.site.get('search', False),
+                                         compact=True, src=f'{rel_root}/{SHARED_SIDEBAR_PAGE}')
+            else:
+                sidebar = self.full_sidebar(page_dir, compact)
+            self._sidebars[(rel_root, compact)] = sidebar
+        return sidebar
+
+    def full_sidebar(self, page_dir: str, compact: bool = False) -> str:
+        index: BlogIndex = self.site['index']
+        return render_sidebar(index.months, index.cat_counts, page_dir, self.root,
+                              index.month_counts, self.site['cat_dir_map'],
+                              index.latest(LATEST_POST_COUNT), self.site.get('search', False), compact)
+
+    def page(self, title: str, content: str, page_dir: str, navigation: str,
+             article_pos: str = "", article_pos_html: str | None = None, compact: bool = False) -> str:
+        """Return the full HTML document for one page (``compact``: see :func:`render_sidebar`)."""
+        if article_pos_html is not None:
+            pos = f"<div class='article_pos'>{article_pos_html}</div>\n"
+        elif article_pos:
+            pos = f"<div class='article_pos'>{html.escape(article_pos)}</div>\n"
+        else:
+            pos = ""
+        nav = f"<div class='nav'>{navigation}</div>\n"
+        # %TITLE% placeholder in header will be replaced
+        header = html.escape(title).join(self.header_parts) if len(self.header_parts) > 1 else self.header_parts[0]
+        return "".join([
+            header,
+            self.body_head, pos, nav, content, "\n", pos, nav,
+            self.body_tail, self.sidebar(page_dir, compact),
+            self.footer,
+        ])
 
 
 # =============================
-# Build process
+# Minification (--minify)
 # =============================
 
-def build():
-    all_entries = [e for e in parse_entries() if e.get('date')]
-    now_jst = datetime.now(JST)
-    
-    # 環境変数から実行環境を判定、GitHub上で実行されたときとそれ以外で処理分岐
-    # (日付が未来なら生成HTMLから無視する処理など)
-    is_github = os.environ.get('GITHUB_ACTIONS') == 'true'
+# Elements whose contents are kept byte for byte (<style> only loses its
+# comments and indentation)
+_MINIFY_KEEP_RE = re.compile(r"<(pre|textarea|script|style)\b[^>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_HTML_COMMENT_RE = re.compile(r"<!--(?!\[if|<!|>).*?-->", re.DOTALL)
+_CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+# Only ASCII whitespace is collapsed: the author indents with full-width
+# spaces (　), which must survive, as must &nbsp;.
+_ASCII_SPACE = ' \t\r\f'
+_DEFAULT_TYPE_RE = re.compile(r"""(<(?:script|style|link)\b[^>]*?)\s+type\s*=\s*(["'])text/(?:javascript|css)\2""",
+                              re.IGNORECASE)
+
+
+def _collapse_lines(text: str) -> str:
+    """Replace whitespace around line breaks (indentation, blank lines) by one break."""
+    # str.strip per line is several times faster than a regex that has to
+    # start a match at every space of the page
+    lines = text.split('\n')
+    if len(lines) == 1:
+        return text
+    middle = [line.strip(_ASCII_SPACE) for line in lines[1:-1]]
+    return "\n".join([lines[0].rstrip(_ASCII_SPACE), *filter(None, middle), lines[-1].lstrip(_ASCII_SPACE)])
+
+
+def _minify_markup(text: str) -> str:
+    text = _HTML_COMMENT_RE.sub('', text)
+    text = _collapse_lines(text)
+    return _DEFAULT_TYPE_RE.sub(r'\1', text)
+
+
+def minify_html(page: str) -> str:
+    """Drop whitespace and comments a browser ignores.
+
+    Conservative on purpose: indentation and blank lines collapse into a
+    single line break, comments (not conditional ones) and default
+    ``type`` attributes go, and everything else stays — runs of spaces
+    inside a line (titles and attribute values use them), full-width
+    spaces, and the contents of <pre>, <textarea> and <script>.
+    """
+    out = []
+    pos = 0
+    for m in _MINIFY_KEEP_RE.finditer(page):
+        out.append(_minify_markup(page[pos:m.start()]))
+        block = m.group(0)
+        open_end = block.index('>') + 1
+        opening = _DEFAULT_TYPE_RE.sub(r'\1', block[:open_end])
+        if m.group(1).lower() == 'style':
+            css = _collapse_lines(_CSS_COMMENT_RE.sub('', block[open_end:]))
+            out.append(opening + css)
+        else:
+            out.append(opening + block[open_end:])
+        pos = m.end()
+    out.append(_minify_markup(page[pos:]))
+    return "".join(out)
 
-    if is_github:
-        # GitHubなら日付判定する
-        entries = [e for e in all_entries if e['date'] <= now_jst]
-    else:
-        # ローカルなら全部出す
-        entries = all_entries
-    
-    #entries = [e for e in all_entries if e['date'] <= now_jst]
-    
-    entries.sort(key=lambda e: e['date'])  # oldest → newest
-
-    # Load shared header & footer (required)
-    with open(os.path.join('design', 'header.txt'), encoding='utf-8') as f:
-        HEADER_TEMPLATE = f.read()
-    with open(os.path.join('design', 'footer.txt'), encoding='utf-8') as f:
-        FOOTER_TEMPLATE = f.read()
-    with open(os.path.join('design', 'header_in_content.txt'), encoding='utf-8') as f:
-        HEADER_IN_CONTENT = f.read()
-    with open(os.path.join('design', 'footer_end_content.txt'), encoding='utf-8') as f:
-        FOOTER_END_CONTENT = f.read()
 
-    root = 'docs'
-    ensure_dir(root)
+class MinifyStats:
+    """Bytes before/after :func:`minify_html`, per page family (month, category, ...)."""
+
+    def __init__(self):
+        self.families: dict[str, list[int]] = {}
+
+    def add(self, family: str, before: int, after: int):
+        sizes = self.families.setdefault(family, [0, 0, 0])
+        sizes[0] += 1
+        sizes[1] += before
+        sizes[2] += after
+
+    @property
+    def saved(self) -> int:
+        return sum(before - after for _, before, after in self.families.values())
+
+    def format(self) -> str:
+        lines = []
+        for family, (pages, before, after) in self.families.items():
+            pct = 100 * (before - after) / before if before else 0.0
+            lines.append(f"  {family:<10}{pages:>5} page(s) {before / 1024:>10.1f} KB → {after / 1024:>10.1f} KB"
+                         f"  (-{(before - after) / 1024:.1f} KB, -{pct:.1f}%)")
+        return "minify: saved {:.1f} KB\n".format(self.saved / 1024) + "\n".join(lines)
+
+
+# =============================
+# Search index (--search)
+# =============================
+
+# docs/search/<year>.json holds a character bigram index of one year's
+# entries (titles, bodies and extended bodies) and docs/search/index.json
+# lists the years; SEARCH_SCRIPT fetches only the shards it needs.
+SEARCH_DIR = 'search'
+SEARCH_INDEX_VERSION = 1
+# The search page itself (docs/-relative), two levels deep like the archive
+SEARCH_PAGE = 'archive/search/index.html'
+
+_TAG_RE = re.compile(r"<[^>]*>")
+# Full-width ASCII folds to ASCII; the ideographic space and Japanese
+# punctuation and brackets separate words like a space. Bigrams across
+# them are useless and would only bloat the index.
+_SEARCH_FOLD: dict[int, int | str] = {c: c - 0xFEE0 for c in range(0xFF01, 0xFF5F)}
+_SEARCH_FOLD.update({c: ' ' for lo, hi in ((0x3000, 0x3003), (0x3008, 0x3011), (0x3014, 0x301F),
+                                           (0x30FB, 0x30FB), (0x2025, 0x2026))
+                     for c in range(lo, hi + 1)})
+
+
+def search_text(text: str) -> str:
+    """``text`` as the index sees it: no tags or entities, folded width and case."""
+    return html.unescape(_TAG_RE.sub(' ', text)).translate(_SEARCH_FOLD).lower()
+
+
+def search_terms(text: str) -> set[str]:
+    """Character bigrams of ``text``, plus the words that are a single character.
+
+    Bigrams need no tokenizer, so Japanese works as well as English; the
+    search page looks a query up by its bigrams and intersects the hits.
+    """
+    terms: set[str] = set()
+    for word in search_text(text).split():
+        if len(word) == 1:
+            terms.add(word)
+        else:
+            terms.update(map(str.__add__, word, word[1:]))
+    return terms
+
+
+def build_search_shard(year: str, entries: list[Entry]) -> str:
+    """JSON index of one year's ``entries`` (newest first, as the master index).
+
+    ``docs`` is ``[[anchor, title, category], ...]``; the page URL follows
+    from the anchor. ``terms`` maps entry numbers to the terms found in
+    them: each item is ``[gaps, "term term ..."]``, the numbers ascending
+    and delta-encoded (``"0,2,3"`` is stored as ``"1,2,1"``). Most bigrams
+    occur in a single entry, so terms with the same entries share an item.
+    """
+    postings: dict[str, list[int]] = defaultdict(list)
+    for i, e in enumerate(entries):
+        for term in search_terms(f"{e.title}\n{e.body}\n{e.extended}"):
+            postings[term].append(i)
+    groups: dict[str, list[str]] = defaultdict(list)
+    for term, ids in postings.items():
+        gaps = str(ids[0] + 1) if len(ids) == 1 else ",".join(map(str, map(int.__sub__, ids, [-1] + ids)))
+        groups[gaps].append(term)
+    return json.dumps({
+        'version': SEARCH_INDEX_VERSION,
+        'year': year,
+        'docs': [[e.anchor_id, e.title, e.category] for e in entries],
+        'terms': [[gaps, " ".join(sorted(terms))] for gaps, terms in sorted(groups.items())],
+    }, ensure_ascii=False, separators=(',', ':')) + "\n"
+
+
+def write_search_index(site: dict, writer: SiteWriter, entry_digests: dict[str, str],
+                       code_digest: str | None, old: dict[str, list[str]]) -> dict[str, list[str]]:
+    """Write the year shards and ``search/index.json``.
+
+    A shard is only rebuilt when the entries of its year changed since the
+    build recorded in ``old`` (normally just the current year); like the
+    entry fragments, unchanged shards are reused by full builds as well.
+    Returns ``{year: [signature, content digest]}`` for the manifest.
+    """
+    index: BlogIndex = site['index']
+    search_dir = os.path.join(site['root'], SEARCH_DIR)
+    shards: dict[str, list[str]] = {}
+    rebuilt = 0
+    for year in index.years:
+        entries = index.by_year[year]
+        path = os.path.join(search_dir, f'{year}.json')
+        sig = digest([SEARCH_INDEX_VERSION, code_digest,
+                      [(e.anchor_id, entry_digests[e.anchor_id]) for e in entries]])
+        known = old.get(year)
+        if known and known[0] == sig and (file_digest(path) or '')[:10] == known[1]:
+            writer.keep(path)
+            shards[year] = known
+            continue
+        content = build_search_shard(year, entries)
+        writer.write(path, content)
+        shards[year] = [sig, hashlib.sha1(content.encode('utf-8')).hexdigest()[:10]]
+        rebuilt += 1
+    # [year, entries, version] newest first; the version busts cached shards
+    years = [[year, len(index.by_year[year]), shards[year][1]] for year in index.years]
+    writer.write(os.path.join(search_dir, 'index.json'),
+                 json.dumps({'version': SEARCH_INDEX_VERSION, 'years': years}, separators=(',', ':')) + "\n")
+    print(f"search index: {rebuilt} of {len(index.years)} year file(s) rebuilt")
+    return shards
+
+
+# =============================
+# Build manifest (incremental mode)
+# =============================
+
+# Stored under docs/ so the next (incremental) build can tell which pages are
+# already up to date. Bump the version when the manifest layout changes.
+MANIFEST_NAME = '.build_manifest.json'
+MANIFEST_VERSION = 1
+
+# Inputs that affect every page. The build script itself is included so that
+# a change in rendering code invalidates all previously generated pages.
+TEMPLATE_FILES = [
+    os.path.join('design', 'header.txt'),
+    os.path.join('design', 'footer.txt'),
+    os.path.join('design', 'header_in_content.txt'),
+    os.path.join('design', 'footer_end_content.txt'),
+    os.path.join('design', 'categories.json'),
+]
+
+
+def digest(obj) -> str:
+    """Return a stable hex digest for JSON-serialisable data."""
+    data = json.dumps(obj, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def file_digest(path: str) -> str | None:
+    """Return the SHA-1 of a file's bytes, or ``None`` if it does not exist."""
+    h = hashlib.sha1()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+    except FileNotFoundError:
+        return None
+    return h.hexdigest()
+
+
+def entry_digest(entry: Entry, image_sizes: dict[str, tuple[int, int]] | None = None,
+                 thumbnails: dict[str, list[tuple[int, str]]] | None = None) -> str:
+    """Digest of everything in an entry that ends up in rendered HTML."""
+    # Bodies are compared by the digest taken at parse time, so they need
+    # not be loaded; the secret only matters for bodies that use it. The
+    # sizes and thumbnails of linked images end up in the <img> tags.
+    secret = hashlib.sha1(secret_text.encode('utf-8')).hexdigest() if entry.has_secret else None
+    sizes = [(ref, image_sizes.get(ref)) for ref in entry.asset_refs] if image_sizes else None
+    if thumbnails:
+        sizes = [(ref, size, thumbnails.get(ref)) for ref, size in sizes or []]
+    return digest([entry.title, entry.category, entry.date_str,
+                   entry.body_sha1, entry.extended_sha1, secret, sizes])
+
+
+def load_manifest(root: str) -> dict:
+    path = os.path.join(root, MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}
+    return manifest
+
+
+def save_manifest(writer: SiteWriter, manifest: dict):
+    writer.write(os.path.join(writer.root, MANIFEST_NAME),
+               json.dumps(manifest, ensure_ascii=False, sort_keys=True, indent=1) + '\n')
+
+
+# =============================
+# Publish schedule (--if-due)
+# =============================
+
+# On GitHub entries dated in the future are left out (select_entries), so the
+# scheduled workflow has to rebuild for them to go live, final_letter.txt
+# included. Every build records when the next of them is due, together with
+# a digest of its inputs, so that a scheduled run can tell in a few
+# milliseconds whether building would change anything. Only dates are
+# stored: docs/ is public and the titles are not published yet.
+SCHEDULE_NAME = '.publish_schedule.json'
+SCHEDULE_VERSION = 1
+
+
+def build_inputs_digest(options: dict, root: str = 'docs') -> str:
+    """Digest of everything a build reads besides the clock.
+
+    That is the sources, templates, this script and the build options, plus
+    the assets (source_img/ and source_js/ give the image sizes, thumbnails
+    and ``?v=`` versions; the published copies are covered by sync_assets'
+    manifest), the secret (only its hash) and whether this runs on GitHub.
+    """
+    files = sorted(glob.glob(os.path.join('source_txt', '*.txt'))) + TEMPLATE_FILES
+    for _, src_root in ASSET_SOURCES:
+        for dir_path, dir_names, file_names in os.walk(src_root):
+            dir_names.sort()
+            files += [os.path.join(dir_path, name) for name in sorted(file_names)]
+    files.append(os.path.join(root, '.asset_manifest.json'))
+    inputs = {path.replace(os.sep, '/'): file_digest(path) for path in files}
+    inputs['scripts/build.py'] = file_digest(os.path.abspath(__file__))
+    environment = {'secret': hashlib.sha1(secret_text.encode('utf-8')).hexdigest(),
+                   'github': is_running_on_github()}
+    return digest([inputs, options, environment])
+
+
+def save_schedule(writer: SiteWriter, pending: list[Entry], inputs: str):
+    """Record the publish dates of the entries this build left out."""
+    dates = sorted({e.date.isoformat() for e in pending})
+    writer.write(os.path.join(writer.root, SCHEDULE_NAME),
+                 json.dumps({'version': SCHEDULE_VERSION, 'inputs': inputs, 'pending': dates}, indent=1) + '\n')
+
+
+def build_due(options: dict, root: str = 'docs', now: datetime | None = None) -> str | None:
+    """Why a build is needed now, or ``None`` if the last one is still current."""
+    try:
+        with open(os.path.join(root, SCHEDULE_NAME), encoding='utf-8') as f:
+            schedule = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return "no publish schedule from an earlier build"
+    if not isinstance(schedule, dict) or schedule.get('version') != SCHEDULE_VERSION:
+        return "no publish schedule from an earlier build"
+    if schedule.get('inputs') != build_inputs_digest(options, root):
+        return "sources, assets, templates or options changed"
+    now = now or datetime.now(JST)
+    due = [date for date in schedule.get('pending', []) if datetime.fromisoformat(date) <= now]
+    if due:
+        return f"{len(due)} entry date(s) due since {due[0]}"
+    return None
+
+
+# =============================
+# Build profile (--profile)
+# =============================
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS in the profile
+    resource = None
+
+
+class BuildProfile:
+    """Wall time, CPU time and peak memory per build phase.
+
+    Disabled by default, in which case :meth:`phase` costs next to nothing.
+    When enabled, the process's peak RSS is read after every phase (it only
+    ever grows, so it shows the phase where the high-water mark was hit).
+    With ``memory``, tracemalloc runs for the whole build and gives the peak
+    of Python allocations within each phase; it makes allocation-heavy
+    phases several times slower (the search index about 10x), so it is opt-in.
+    With ``cprofile``, every phase is also run under its own
+    :class:`cProfile.Profile` so the slowest one can be dumped afterwards.
+    CPU time includes finished child processes (``--jobs``).
+    """
+
+    def __init__(self, enabled: bool = False, cprofile: bool = False, memory: bool = False):
+        self.enabled = enabled
+        self.memory = enabled and memory
+        self.phases: dict[str, dict] = {}
+        self.counters: dict[str, int] = defaultdict(int)
+        self._profilers: dict[str, cProfile.Profile] | None = {} if cprofile else None
+        self._start = time.perf_counter()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @staticmethod
+    def _cpu() -> float:
+        t = os.times()
+        return t.user + t.system + t.children_user + t.children_system
+
+    @staticmethod
+    def max_rss(who: int | None = None) -> int | None:
+        """Peak resident set size in bytes of this process (or ``who``)."""
+        if resource is None:
+            return None
+        rss = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024  # kB elsewhere
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        profiler = None
+        if self._profilers is not None:
+            profiler = self._profilers.setdefault(name, cProfile.Profile())
+            profiler.enable()
+        if self.memory:
+            tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), self._cpu()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, self._cpu() - cpu
+            if profiler is not None:
+                profiler.disable()
+            stats = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0, 'max_rss_bytes': None,
+                                                  'peak_bytes': None, 'calls': 0})
+            stats['wall'] += wall
+            stats['cpu'] += cpu
+            stats['max_rss_bytes'] = self.max_rss()
+            if self.memory:
+                stats['peak_bytes'] = max(stats['peak_bytes'] or 0, tracemalloc.get_traced_memory()[1])
+            stats['calls'] += 1
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            self.counters[name] += n
+
+    def slowest(self) -> str | None:
+        return max(self.phases, key=lambda name: self.phases[name]['wall'], default=None)
+
+    def report(self) -> dict:
+        return {
+            'created': datetime.now(JST).isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'wall': time.perf_counter() - self._start,
+            'max_rss_bytes': self.max_rss(),
+            'children_max_rss_bytes': self.max_rss(resource.RUSAGE_CHILDREN) if resource else None,
+            'peak_bytes': tracemalloc.get_traced_memory()[1] if self.memory else None,
+            'phases': self.phases,
+            'counters': dict(self.counters),
+            'slowest': self.slowest(),
+        }
+
+    def format(self) -> str:
+        def mb(n: int | None) -> str:
+            return f"{n / 2**20:>10.1f}" if n is not None else f"{'-':>10}"
+
+        header = f"{'phase':<16}{'wall (s)':>10}{'cpu (s)':>10}{'RSS MB':>10}"
+        lines = [header + (f"{'peak MB':>10}" if self.memory else "") + f"{'calls':>8}"]
+        for name, st in self.phases.items():
+            lines.append(f"{name:<16}{st['wall']:>10.3f}{st['cpu']:>10.3f}{mb(st['max_rss_bytes'])}"
+                         + (mb(st['peak_bytes']) if self.memory else "") + f"{st['calls']:>8}")
+        lines.append("  ".join(f"{k}={v}" for k, v in self.counters.items()))
+        return "\n".join(lines)
+
+    def save(self, path: str, cprofile_path: str | None = None):
+        """Write the JSON report, and the cProfile stats of the slowest phase."""
+        report = self.report()
+        if cprofile_path and self._profilers and report['slowest']:
+            self._profilers[report['slowest']].dump_stats(cprofile_path)
+            report['cprofile'] = {'phase': report['slowest'], 'path': cprofile_path}
+        if os.path.dirname(path):
+            ensure_dir(os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+            f.write('\n')
+        return report
 
-    # Load category directory mapping if available
-    mapping_path = os.path.join('design', 'categories.json')
 
+# =============================
+# Build process
+# =============================
+
+# Generated HTML under docs/ (relative globs). Anything matching these that
+# the current build did not produce is stale and gets deleted.
+GENERATED_PAGES = [
+    'index.html',
+    os.path.join('archive', '*', '*.html'),
+    os.path.join('category', '*', '*.html'),
+]
+GENERATED_THUMBNAILS = [os.path.join(THUMBNAIL_DIR, '**', '*.*')]
+GENERATED_EXTENDED = [os.path.join(EXTENDED_DIR, '*', '*.html')]
+GENERATED_SEARCH = [os.path.join(SEARCH_DIR, '*.json')]
+GENERATED_PERMALINKS = [os.path.join(PERMALINK_DIR, '*', '*.html')]
+
+def load_templates() -> dict[str, str]:
+    """Load shared header & footer (required)."""
+    templates = {}
+    for key, name in (('header', 'header.txt'), ('footer', 'footer.txt'),
+                      ('header_in_content', 'header_in_content.txt'),
+                      ('footer_end_content', 'footer_end_content.txt')):
+        with open(os.path.join('design', name), encoding='utf-8') as f:
+            templates[key] = f.read()
+    return templates
+
+
+def template_asset_refs() -> list[str]:
+    """Assets the page templates link to (scripts, stylesheets, banners)."""
+    refs: list[str] = []
+    for name in sorted(glob.glob(os.path.join('design', '*.txt'))):
+        with open(name, 'rb') as f:
+            refs += [r for r in find_asset_refs(f.read()) if r not in refs]
+    return refs
+
+
+def missing_assets(entries: list[Entry], root: str = 'docs') -> dict[str, list[Entry]]:
+    """Referenced assets that exist neither under ``root`` nor in their source dir.
+
+    Maps the docs/-relative path to the entries using it (an empty list for
+    the templates). Such links 404 on the published site.
+    """
+    users: dict[str, list[Entry]] = {ref: [] for ref in template_asset_refs()}
+    for e in entries:
+        for ref in e.asset_refs:
+            users.setdefault(ref, []).append(e)
+    sources = dict(ASSET_SOURCES)
+    missing = {}
+    for ref, used_by in users.items():
+        top, rest = ref.split('/', 1)
+        if not (os.path.isfile(os.path.join(root, ref)) or os.path.isfile(os.path.join(sources[top], rest))):
+            missing[ref] = used_by
+    return missing
+
+
+def report_missing_assets(missing: dict[str, list[Entry]]):
+    for ref, used_by in sorted(missing.items()):
+        if not used_by:
+            report_issue('design', 0, f"missing asset {ref}")
+        for e in used_by:
+            report_issue(e.source, e.line_start, f"missing asset {ref} (in {e.title!r})")
+
+
+def load_cat_dir_map() -> dict[str, str]:
+    """Load category directory mapping if available."""
+    mapping_path = os.path.join('design', 'categories.json')
     if os.path.exists(mapping_path):
         with open(mapping_path, encoding='utf-8') as f:
-            cat_dir_map: dict[str, str] = json.load(f)
-    else:
-        cat_dir_map = {}
+            return json.load(f)
+    return {}
 
-    # Group by month & category
-    month_map: dict[tuple[str, str], list[dict]] = defaultdict(list)
-    cat_map: dict[str, list[dict]] = defaultdict(list)
-    month_counts: dict[tuple[str, str], int] = {}
 
-    for e in entries:
-        ym = (e['date'].strftime('%Y'), e['date'].strftime('%m'))
-        month_map[ym].append(e)
-        cats = e.get('categories') or ['']
-        if not cats:
-            cat_map[''].append(e)
-        else:
-            for c in cats:
-                cat_map[c].append(e)
+# Entries per category page
+CATEGORY_PAGE_SIZE = 10
+
 
-    for ym, lst in month_map.items():
-        month_counts[ym] = len(lst)
+class BlogIndex:
+    """Entries grouped once, in the order the pages show them.
 
-    cat_counts = {cat: len(lst) for cat, lst in cat_map.items()}
+    Built in a single pass over the entries newest first, so the month,
+    category and year views are already in page order and never sorted
+    again. Entries with the same date keep their source order. Month
+    navigation and category pagination are plain lookups.
+    """
 
+    def __init__(self, entries: list[Entry], per_page: int = CATEGORY_PAGE_SIZE):
+        self.entries = entries  # oldest → newest
+        self.per_page = per_page
+        # sorted() is stable, so entries with the same date keep their order
+        self.newest_first = sorted(entries, key=lambda e: e.date, reverse=True)
+        by_month: dict[tuple[str, str], list[Entry]] = defaultdict(list)
+        by_category: dict[str, list[Entry]] = defaultdict(list)
+        by_year: dict[str, list[Entry]] = defaultdict(list)
+        for e in self.newest_first:
+            by_month[(e.year, e.month)].append(e)
+            by_year[e.year].append(e)
+            for c in e.categories or ['']:
+                by_category[c].append(e)
+        self.by_month = dict(by_month)        # newest first within each month
+        self.by_category = dict(by_category)  # newest first
+        self.by_year = dict(by_year)          # newest first
+        self.months = sorted(self.by_month)   # ascending
+        self.years = sorted(self.by_year, reverse=True)
+        self._month_pos = {ym: i for i, ym in enumerate(self.months)}
+        self._entry_pos = {e.anchor_id: i for i, e in enumerate(entries)}
+        self.month_counts = {ym: len(es) for ym, es in self.by_month.items()}
+        self.cat_counts = {cat: len(es) for cat, es in self.by_category.items()}
+
+    def latest(self, n: int) -> list[Entry]:
+        return self.newest_first[:n] if n > 0 else []
+
+    def month_neighbours(self, ym: tuple[str, str]) -> tuple[tuple[str, str] | None, tuple[str, str] | None]:
+        """(older month, newer month) of ``ym``, None at either end."""
+        i = self._month_pos[ym]
+        older = self.months[i - 1] if i > 0 else None
+        newer = self.months[i + 1] if i + 1 < len(self.months) else None
+        return older, newer
+
+    def entry(self, anchor: str) -> Entry:
+        return self.entries[self._entry_pos[anchor]]
+
+    def entry_neighbours(self, anchor: str) -> tuple[Entry | None, Entry | None]:
+        """(older entry, newer entry) of the entry with ``anchor``, None at either end."""
+        i = self._entry_pos[anchor]
+        older = self.entries[i - 1] if i > 0 else None
+        newer = self.entries[i + 1] if i + 1 < len(self.entries) else None
+        return older, newer
+
+    def newest_months(self, n: int) -> list[tuple[str, str]]:
+        return self.months[::-1][:n]
+
+    def category_page_count(self, cat: str) -> int:
+        return (len(self.by_category[cat]) + self.per_page - 1) // self.per_page
+
+    def category_page(self, cat: str, page_num: int) -> list[Entry]:
+        """Entries on page ``page_num`` (1-based) of a category, newest first."""
+        start = (page_num - 1) * self.per_page
+        return self.by_category[cat][start:start + self.per_page]
+
+
+def prepare_site(entries: list[Entry], cat_dir_map: dict[str, str], root: str = 'docs') -> dict:
+    """Index date-ordered entries and assign anchors.
+
+    Returns the shared state every page renderer reads from.
+    """
     # Assign unique anchor ids for each entry based on the date. If multiple
     # entries share the same date, add alphabetical suffixes (A, B, ...).
     anchor_counter: dict[str, int] = defaultdict(int)
 
     for e in entries:
-        key = e['date'].strftime('%Y-%m-%d')
+        key = e.iso_date
         idx = anchor_counter[key]
         anchor_counter[key] += 1
         if idx == 0:
             anchor = key
         else:
             anchor = f"{key}{chr(ord('A') + idx - 1)}"
-        e['anchor_id'] = anchor
-        cats = e.get('categories') or ['']
-        e['cat_dirs'] = [get_cat_dir(c, cat_dir_map) for c in cats]
+        e.anchor_id = anchor
+        e.cat_dirs = [get_cat_dir(c, cat_dir_map) for c in e.categories or ['']]
 
-    if LATEST_POST_COUNT > 0:
-        recent_entries = sorted(entries, key=lambda x: x['date'], reverse=True)[:LATEST_POST_COUNT]
+    return {
+        'root': root,
+        'index': BlogIndex(entries),
+        'cat_dir_map': cat_dir_map,
+    }
+
+
+def render_entries(site: dict, entries: list[Entry], page_dir: str, last_next: str = 'bottom') -> str:
+    """Render a list of entries, each pointing its ▼ link at the next one
+    (the last one at ``last_next``)."""
+    fragments: EntryFragments = site['fragments']
+    blocks: list[str] = []
+    for i, ent in enumerate(entries):
+        next_id = entries[i + 1].anchor_id if i < len(entries) - 1 else last_next
+        blocks.append(fragments.block(ent, next_id, page_dir, site['root']))
+    return '<br><br><br>\n'.join(blocks)
+
+
+# -------------------------
+# Page plan
+# -------------------------
+# Each page is described by a small spec tuple:
+#   ('month', year, month) / ('category', cat, page_num) / ('top',) / ('master',)
+#   / ('search',) / ('entry', anchor)
+
+def plan_pages(site: dict) -> list[tuple]:
+    index: BlogIndex = site['index']
+    specs: list[tuple] = [('month', y, m) for y, m in index.months]
+    for cat in index.by_category:
+        for page_num in range(1, index.category_page_count(cat) + 1):
+            specs.append(('category', cat, page_num))
+    if index.months:
+        specs.append(('top',))
+    specs.append(('master',))
+    if site.get('search'):
+        specs.append(('search',))
+    if site.get('permalinks'):
+        specs.extend(('entry', e.anchor_id) for e in index.entries)
+    return specs
+
+
+def page_path(site: dict, spec: tuple) -> str:
+    root = site['root']
+    kind = spec[0]
+    if kind == 'month':
+        return os.path.join(root, 'archive', spec[1], f'{spec[2]}.html')
+    if kind == 'category':
+        safe = get_cat_dir(spec[1], site['cat_dir_map'])
+        return os.path.join(root, 'category', safe, f'{spec[2]:03d}.html')
+    if kind == 'top':
+        return os.path.join(root, 'archive', 'top', 'index.html')
+    if kind == 'search':
+        return os.path.join(root, *SEARCH_PAGE.split('/'))
+    if kind == 'entry':
+        return os.path.join(root, *permalink_path(site['index'].entry(spec[1])).split('/'))
+    return os.path.join(root, 'index.html')
+
+
+def page_dependencies(site: dict, spec: tuple) -> tuple[list[Entry], list]:
+    """Return (entries shown on the page, other page-specific inputs).
+
+    Together with the layout signature these determine the page output, and
+    they are what the incremental build compares against the manifest.
+    """
+    index: BlogIndex = site['index']
+    kind = spec[0]
+    if kind == 'month':
+        ym = (spec[1], spec[2])
+        return index.by_month[ym], list(index.month_neighbours(ym))
+    if kind == 'category':
+        return index.category_page(spec[1], spec[2]), [len(index.by_category[spec[1]])]
+    if kind == 'top':
+        # Newest three months: the two shown on the top page plus the 前へ target
+        months = index.newest_months(3)
+        shown: list[Entry] = []
+        for ym in months[:2]:
+            shown.extend(index.by_month[ym])
+        return shown, months
+    if kind == 'search':
+        # The entries are in the index files; the page only lists the years
+        return [], index.years
+    if kind == 'entry':
+        # Neighbours are linked by anchor, with their title as tooltip
+        neighbours = [[e.anchor_id, e.title] if e else None for e in index.entry_neighbours(spec[1])]
+        return [index.entry(spec[1])], neighbours
+    return index.entries, []
+
+
+def layout_signature(site: dict, templates_digest: dict[str, str | None]) -> str:
+    """Digest of the inputs shared by every page (templates, sidebar, env).
+
+    With ``shared_sidebar`` the months, counts and latest entries are only
+    in :data:`SHARED_SIDEBAR_PAGE`, so they are left out here.
+    """
+    index: BlogIndex = site['index']
+    sidebar = [] if site.get('shared_sidebar') else [
+        index.months,
+        sorted(index.month_counts.items()),
+        sorted(index.cat_counts.items()),
+        [(e.anchor_id, e.title, e.date_str) for e in index.latest(LATEST_POST_COUNT)],
+    ]
+    return digest([
+        templates_digest,
+        is_running_on_github(),
+        site.get('lazy_extended', False),
+        site.get('asset_versions', {}),
+        site.get('minify', False),
+        site.get('search', False),
+        site.get('permalinks', False),
+        site.get('top_shell', False),
+        site.get('sharded_index', False),
+        site.get('shared_sidebar', False),
+        site['cat_dir_map'],
+        sidebar,
+    ])
+
+
+def page_signature(site: dict, spec: tuple, layout_sig: str,
+                   entry_digests: dict[str, str]) -> tuple[str, list[str]]:
+    deps, extra = page_dependencies(site, spec)
+    anchors = [e.anchor_id for e in deps]
+    sig = digest([layout_sig, list(spec), extra,
+                  [(a, entry_digests[a]) for a in anchors]])
+    return sig, anchors
+
+
+# -------------------------
+# Page renderers
+# -------------------------
+
+def render_month_page(site: dict, year: str, month: str) -> str:
+    root = site['root']
+    page_dir = os.path.join(root, 'archive', year)
+    month_entries, (older_key, newer_key) = page_dependencies(site, ('month', year, month))
+
+    # Build navigation ( "次の月へ | 前の月へ" )
+    if newer_key:
+        newer_link = os.path.relpath(os.path.join(root, 'archive', newer_key[0], f'{newer_key[1]}.html'), page_dir)
+        next_html = f"<a href='{newer_link}'>次の月へ</a>"
     else:
-        recent_entries = []
+        next_html = "<span style='color:#ccc'>次の月へ</span>"
 
-    months_sorted = sorted(month_map.keys())  # ascending
+    if older_key:
+        older_link = os.path.relpath(os.path.join(root, 'archive', older_key[0], f'{older_key[1]}.html'), page_dir)
+        prev_html = f"<a href='{older_link}'>前の月へ</a>"
+    else:
+        prev_html = "<span style='color:#ccc'>前の月へ</span>"
 
-    # -------------------------
-    # Monthly archive pages
-    # -------------------------
-    for idx, ym in enumerate(months_sorted):
-        year, month = ym
-        page_dir = os.path.join(root, 'archive', year)
-        page_path = os.path.join(page_dir, f'{month}.html')
+    navigation = f"{next_html} | {prev_html}"
 
-        older_key = months_sorted[idx-1] if idx > 0 else None  # 前 = older
-        newer_key = months_sorted[idx+1] if idx < len(months_sorted)-1 else None  # 次 = newer
+    entry_html = render_entries(site, month_entries, page_dir)
+    return site['layout'].page(f'{year}-{month}', entry_html, page_dir, navigation, f'{year}年{month}月')
 
-        # Build navigation ( "次の月へ | 前の月へ" )
-        if newer_key:
-            newer_link = os.path.relpath(os.path.join(root, 'archive', newer_key[0], f'{newer_key[1]}.html'), page_dir)
-            next_html = f"<a href='{newer_link}'>次の月へ</a>"
-        else:
-            next_html = "<span style='color:#ccc'>次の月へ</span>"
 
-        if older_key:
-            older_link = os.path.relpath(os.path.join(root, 'archive', older_key[0], f'{older_key[1]}.html'), page_dir)
-            prev_html = f"<a href='{older_link}'>前の月へ</a>"
-        else:
-            prev_html = "<span style='color:#ccc'>前の月へ</span>"
-
-        navigation = f"{next_html} | {prev_html}"
-
-        # Render entries for that month, newest first
-        month_entries = sorted(month_map[ym], key=lambda x: x['date'], reverse=True)
-        blocks: list[str] = []
-        for i, ent in enumerate(month_entries):
-            next_id = month_entries[i + 1]['anchor_id'] if i < len(month_entries) - 1 else 'bottom'
-            blocks.append(render_entry_block(ent, ent['anchor_id'], next_id, page_dir, root))
-        entry_html = '<br><br><br>\n'.join(blocks)
-
-        sidebar = render_sidebar(months_sorted, cat_counts, page_dir, root, month_counts, cat_dir_map, recent_entries)
-        body_html = render_body(
-            f'{year}-{month}',
-            entry_html,
-            sidebar,
-            navigation,
-            HEADER_IN_CONTENT,
-            FOOTER_END_CONTENT,
-            f'{year}年{month}月',
-        )
-        full_html = assemble_full_page(f'{year}-{month}', body_html, HEADER_TEMPLATE, FOOTER_TEMPLATE)
-        write_file(page_path, full_html)
-
-    # -------------------------
-    # Category pages (10 posts each)
-    # -------------------------
-    for cat, es in cat_map.items():
-        es_sorted = sorted(es, key=lambda x: x['date'], reverse=True)
-        safe = get_cat_dir(cat, cat_dir_map)
-        for idx in range(0, len(es_sorted), 10):
-            chunk = es_sorted[idx:idx+10]
-            page_num = idx // 10 + 1
-            page_dir = os.path.join(root, 'category', safe)
-            page_path = os.path.join(page_dir, f'{page_num:03d}.html')
-
-            # Category navigation (次 | 前)
-            if page_num > 1:
-                newer_link = f'{page_num-1:03d}.html'
-                next_html = f"<a href='{newer_link}'>次のページ</a>"
-            else:
-                next_html = "<span style='color:#ccc'>次のページ</span>"
+def render_category_page(site: dict, cat: str, page_num: int) -> str:
+    """Category pages (10 posts each)."""
+    root = site['root']
+    safe = get_cat_dir(cat, site['cat_dir_map'])
+    page_dir = os.path.join(root, 'category', safe)
+    chunk, _ = page_dependencies(site, ('category', cat, page_num))
+    total_pages = site['index'].category_page_count(cat)
 
-            if idx + 10 < len(es_sorted):
-                older_link = f'{page_num+1:03d}.html'
-                prev_html = f"<a href='{older_link}'>前のページ</a>"
-            else:
-                prev_html = "<span style='color:#ccc'>前のページ</span>"
-            navigation = f"{next_html} | {prev_html}"
-
-            blocks = []
-            for i, ent in enumerate(chunk):
-                next_id = chunk[i + 1]['anchor_id'] if i < len(chunk) - 1 else 'bottom'
-                blocks.append(render_entry_block(ent, ent['anchor_id'], next_id, page_dir, root))
-            entry_html = '<br><br><br>\n'.join(blocks)
-            sidebar = render_sidebar(months_sorted, cat_counts, page_dir, root, month_counts, cat_dir_map, recent_entries)
-            total_pages = (len(es_sorted) + 9) // 10
-            pos_text = f"{cat or 'uncategorized'}　{page_num}/{total_pages}"
-            rel_root = os.path.relpath(root, page_dir)
-            if page_num != total_pages and total_pages > 1:
-                last_link = f"{rel_root}/category/{safe}/{total_pages:03d}.html"
-                pos_html = f"{html.escape(cat or 'uncategorized')}　{page_num}/<a href='{last_link}'>{total_pages}</a>"
-            else:
-                pos_html = None
-            body_html = render_body(
-                cat or 'uncategorized',
-                entry_html,
-                sidebar,
-                navigation,
-                HEADER_IN_CONTENT,
-                FOOTER_END_CONTENT,
-                pos_text,
-                pos_html,
-            )
-            full_html = assemble_full_page(cat or 'uncategorized', body_html, HEADER_TEMPLATE, FOOTER_TEMPLATE)
-            write_file(page_path, full_html)
-
-    # -------------------------
-    # Index page (latest two months)
-    # -------------------------
-    if months_sorted:
-        months_desc = sorted(months_sorted, reverse=True)  # newest first
-        first_month = months_desc[0]
-        second_month = months_desc[1] if len(months_desc) > 1 else None
-
-        entries_for_index: list[dict] = []
-        entries_for_index.extend(sorted(month_map[first_month], key=lambda x: x['date'], reverse=True))
-        if second_month:
-            entries_for_index.extend(sorted(month_map[second_month], key=lambda x: x['date'], reverse=True))
-
-        # Determine link to older month (前へ) – third newest
-        older_link_month = months_desc[2] if len(months_desc) > 2 else None
-
-        if older_link_month:
-            older_link = os.path.relpath(
-                os.path.join(root, 'archive', older_link_month[0], f"{older_link_month[1]}.html"),
-                os.path.join(root, 'archive', 'top')
-            )
-            prev_html = f"<a href='{older_link}'>前へ</a>"
-        else:
-            prev_html = "<span style='color:#ccc'>前へ</span>"
-
-        next_html = "<span style='color:#ccc'>次へ</span>"  # newest page has no newer link
-        navigation = f"{next_html} | {prev_html}"
-
-        page_dir = os.path.join(root, 'archive', 'top')
-        page_path = os.path.join(page_dir, 'index.html')
-
-        blocks = []
-        for i, ent in enumerate(entries_for_index):
-            next_id = entries_for_index[i + 1]['anchor_id'] if i < len(entries_for_index) - 1 else 'bottom'
-            blocks.append(render_entry_block(ent, ent['anchor_id'], next_id, page_dir, root))
-        entry_html = '<br><br><br>\n'.join(blocks)
-        sidebar = render_sidebar(months_sorted, cat_counts, page_dir, root, month_counts, cat_dir_map, recent_entries)
-        body_html = render_body(
-            '開発日誌',
-            entry_html,
-            sidebar,
-            navigation,
-            HEADER_IN_CONTENT,
-            FOOTER_END_CONTENT,
-            'トップ',
+    # Category navigation (次 | 前)
+    if page_num > 1:
+        newer_link = f'{page_num-1:03d}.html'
+        next_html = f"<a href='{newer_link}'>次のページ</a>"
+    else:
+        next_html = "<span style='color:#ccc'>次のページ</span>"
+
+    if page_num < total_pages:
+        older_link = f'{page_num+1:03d}.html'
+        prev_html = f"<a href='{older_link}'>前のページ</a>"
+    else:
+        prev_html = "<span style='color:#ccc'>前のページ</span>"
+    navigation = f"{next_html} | {prev_html}"
+
+    entry_html = render_entries(site, chunk, page_dir)
+    pos_text = f"{cat or 'uncategorized'}　{page_num}/{total_pages}"
+    rel_root = os.path.relpath(root, page_dir)
+    if page_num != total_pages and total_pages > 1:
+        last_link = f"{rel_root}/category/{safe}/{total_pages:03d}.html"
+        pos_html = f"{html.escape(cat or 'uncategorized')}　{page_num}/<a href='{last_link}'>{total_pages}</a>"
+    else:
+        pos_html = None
+    return site['layout'].page(cat or 'uncategorized', entry_html, page_dir, navigation, pos_text, pos_html)
+
+
+def render_top_page(site: dict) -> str:
+    """Index page (latest two months)."""
+    root = site['root']
+    page_dir = os.path.join(root, 'archive', 'top')
+    entries_for_index, months_desc = page_dependencies(site, ('top',))
+
+    # Determine link to older month (前へ) – third newest
+    older_link_month = months_desc[2] if len(months_desc) > 2 else None
+
+    if older_link_month:
+        older_link = os.path.relpath(
+            os.path.join(root, 'archive', older_link_month[0], f"{older_link_month[1]}.html"),
+            page_dir
         )
-        full_html = assemble_full_page('開発日誌', body_html, HEADER_TEMPLATE, FOOTER_TEMPLATE)
-        # Insert no-cache meta tags only on the top index page
-        full_html = HEAD_OPEN_RE.sub(r"\1\n" + NO_CACHE_META, full_html, count=1)
-        write_file(page_path, full_html)
-
-    # -------------------------
-    # Master index page (all titles)
-    # -------------------------
+        prev_html = f"<a href='{older_link}'>前へ</a>"
+    else:
+        prev_html = "<span style='color:#ccc'>前へ</span>"
+
+    next_html = "<span style='color:#ccc'>次へ</span>"  # newest page has no newer link
+    navigation = f"{next_html} | {prev_html}"
+
+    if site.get('top_shell'):
+        # Only this shell is uncached; the entries and the sidebar are
+        # content-named files (write_top_parts) that stay in the browser cache,
+        # or the sidebar is the shared one
+        parts = site['top_parts']
+        placeholders = []
+        for y, m, name in parts['months']:
+            month_link = os.path.relpath(os.path.join(root, 'archive', y, f'{m}.html'), page_dir)
+            placeholders.append(f"<div class='top-month' data-src='{name}'><a href='{month_link}'>{y}年{m}月の記事</a></div>")
+        script = os.path.relpath(os.path.join(root, site['layout'].assets['top-shell.js'][0]), page_dir)
+        entry_html = '<br><br><br>\n'.join(placeholders) + f"\n<script src='{script}' defer></script>"
+        if site.get('shared_sidebar'):
+            full_html = site['layout'].page('開発日誌', entry_html, page_dir, navigation, 'トップ')
+        else:
+            full_html = site['layout'].page('開発日誌', entry_html, page_dir, navigation, 'トップ', compact=True)
+            full_html = full_html.replace("<div id='sidebar'>", f"<div id='sidebar' data-src='{parts['sidebar']}'>", 1)
+    else:
+        entry_html = render_entries(site, entries_for_index, page_dir)
+        full_html = site['layout'].page('開発日誌', entry_html, page_dir, navigation, 'トップ')
+    # Insert no-cache meta tags only on the top index page
+    return HEAD_OPEN_RE.sub(r"\1\n" + NO_CACHE_META, full_html, count=1)
+
+
+def write_top_parts(site: dict, writer: SiteWriter) -> dict:
+    """Write the parts the --top-shell top page loads to archive/top/.
+
+    The entries of each month on the top page and the full sidebar (unless
+    it is shared, see ``shared_sidebar``) go to files named after their
+    content, so a returning reader only downloads the parts that changed.
+    Returns their names for :func:`render_top_page`:
+    ``{'months': [[year, month, name], ...], 'sidebar': name}``.
+    """
+    root = site['root']
+    page_dir = os.path.join(root, 'archive', 'top')
+    index: BlogIndex = site['index']
+    _, months_desc = page_dependencies(site, ('top',))
+    shown = months_desc[:2]
+
+    def put(stem: str, content: str) -> str:
+        if site.get('minify'):
+            content = minify_html(content)
+        name = f"{stem}.{hashlib.sha1(content.encode('utf-8')).hexdigest()[:10]}.html"
+        writer.write(os.path.join(page_dir, name), content)
+        return name
+
+    parts: dict = {'months': []}
+    for i, (y, m) in enumerate(shown):
+        # The last ▼ of a month points at the next month's first entry, as on the full page
+        last_next = index.by_month[shown[i + 1]][0].anchor_id if i + 1 < len(shown) else 'bottom'
+        content = render_entries(site, index.by_month[(y, m)], page_dir, last_next)
+        parts['months'].append([y, m, put(f'{y}-{m}', content)])
+    if not site.get('shared_sidebar'):
+        parts['sidebar'] = put('sidebar', site['layout'].sidebar(page_dir))
+    return parts
+
+
+def render_title_lines(entries: list[Entry], month_dir: str) -> list[str]:
+    """Lines of the master index for ``entries`` of one year, linking to
+    the month pages in ``month_dir`` (relative, with trailing slash)."""
+    lines = []
+    for ent in entries:
+        url = f"{month_dir}{ent.month}.html#{ent.anchor_id}"
+        cat = ent.category
+        cat_html = f" <font class='top_minicategory'>{html.escape(cat)}</font>" if cat else ''
+        lines.append(f"・<a href='{url}' class='blue'>{ent.iso_date}({ent.weekday})　{ent.title_html}</a>{cat_html}<br>")
+    return lines
+
+
+def write_year_indexes(site: dict, writer: SiteWriter) -> dict[str, str]:
+    """Write the title list of each year to archive/<year>/index.html (--sharded-index).
+
+    The files have no sidebar, so a rebuild only rewrites the years whose
+    entries changed. They are read on their own without JavaScript, and
+    the master index loads the ``.master-year`` list from them. Returns
+    ``{year: content digest}``, used as cache buster in the master index.
+    """
+    root = site['root']
+    index: BlogIndex = site['index']
+    versions = {}
+    for y in index.years:
+        entries = index.by_year[y]
+        content = "\n".join([
+            "<!DOCTYPE html>",
+            "<html lang=\"ja\"><head><meta charset=\"utf-8\">"
+            f"<title>{y}年の記事一覧</title></head><body>",
+            f"<h1>{y}年の記事（{len(entries)}件）</h1>",
+            "<div class='master-year'>",
+            *render_title_lines(entries, ''),
+            "</div>",
+            "<p><a href=\"../../index.html\">全記事一覧に戻る</a></p>",
+            "</body></html>",
+        ]) + "\n"
+        if site.get('minify'):
+            content = minify_html(content)
+        writer.write(os.path.join(root, 'archive', y, 'index.html'), content)
+        versions[y] = hashlib.sha1(content.encode('utf-8')).hexdigest()[:10]
+    return versions
+
+
+def render_master_index(site: dict) -> str:
+    """Master index page (all titles, or with --sharded-index the years
+    only, their titles being loaded from :func:`write_year_indexes` files)."""
+    root = site['root']
     page_dir = root
-    page_path = os.path.join(page_dir, 'index.html')
-    all_sorted = sorted(entries, key=lambda x: x['date'], reverse=True)
-    by_year: dict[str, list[dict]] = defaultdict(list)
-    for ent in all_sorted:
-        by_year[ent['date'].strftime('%Y')].append(ent)
-    years = sorted(by_year.keys(), reverse=True)
+    index: BlogIndex = site['index']
+    by_year = index.by_year
+    years = index.years
 
     lines: list[str] = []
-    total_count = len(entries)
+    total_count = len(index.entries)
     lines.append(f"<br><B><font color='#aaaaff'>【全記事一覧】　{total_count}件</font></B><div class='master_years'>")
     year_links = '　'.join([f"<a href='#{y}' class='g'>{y}年</a>" for y in years])
     lines.append(year_links)
-    lines.append("</div><br><br>")
+    search_form = ""
+    if site.get('search'):
+        search_form = (f"<form action='{SEARCH_PAGE}'><input type='search' name='q' size='30' "
+                       "placeholder='タイトル・本文から検索'> <input type='submit' value='検索'></form>")
+    lines.append(f"</div>{search_form}<br><br>")
+    year_versions = site.get('year_indexes')
     for idx, y in enumerate(years):
         lines.append(f"<a id='{y}'></a><H1>{y}年</H1>")
-        for ent in by_year[y]:
-            date = ent['date'].strftime('%Y-%m-%d')
-            weekday = '月火水木金土日'[ent['date'].weekday()]
-            month = ent['date'].strftime('%m')
-            url = f"archive/{y}/{month}.html#{ent['anchor_id']}"
-            title = html.escape(ent['title'])
-            cat = ent.get('category', '')
-            cat_html = f" <font class='top_minicategory'>{html.escape(cat)}</font>" if cat else ''
-            lines.append(f"・<a href='{url}' class='blue'>{date}({weekday})　{title}</a>{cat_html}<br>")
+        if year_versions is not None:
+            src = f"archive/{y}/index.html"
+            lines.append(f"<div class='master-year' data-year='{y}' data-src='{src}?v={year_versions[y]}'>"
+                         f"<a href='{src}' class='g'>＋{y}年の記事（{len(by_year[y])}件）を表示</a></div>")
+        else:
+            lines.extend(render_title_lines(by_year[y], f"archive/{y}/"))
         if idx < len(years) - 1:
             lines.append("<div align='right'><a href='#top' class='g'>▲一番上へ戻る</a></div><br>")
     index_content = "\n".join(lines)
 
-    sidebar = render_sidebar(months_sorted, cat_counts, page_dir, root, month_counts, cat_dir_map, recent_entries)
-    body_html = render_body('記事一覧', index_content, sidebar, '', HEADER_IN_CONTENT, FOOTER_END_CONTENT)
-    full_html = assemble_full_page('記事一覧', body_html, HEADER_TEMPLATE, FOOTER_TEMPLATE)
+    full_html = site['layout'].page('記事一覧', index_content, page_dir, '')
     # Adjust script path for root index and add scroll position persistence
     full_html = full_html.replace('../../js/', 'js/')
-    scroll_js = (
-      "<script>\n"
-      "// 1. 自動スクロール復元をオフ\n"
-      "if ('scrollRestoration' in history) {\n"
-      "history.scrollRestoration = 'manual';\n"
-      "}\n"
-      "// 2. 保存・復元ロジック\n"
-      "const KEY = 'index-scroll';\n"
-      "const saveScroll = () => {\n"
-      "sessionStorage.setItem(KEY, window.pageYOffset);\n"
-      "};\n"
-      "const restoreScroll = () => {\n"
-      "const p = sessionStorage.getItem(KEY);\n"
-      "if (p !== null) {\n"
-      "window.scrollTo(0, parseInt(p, 10));\n"
-      "}\n"
-      "};\n"
-      "// 3. 保存は pagehide で\n"
-      "window.addEventListener('pagehide', saveScroll);\n"
-      "// 4. 復元は load と pageshow で\n"
-      "window.addEventListener('load', restoreScroll);\n"
-      "window.addEventListener('pageshow', restoreScroll);\n"
-      "</script>\n"
-    )
-    full_html = full_html.replace('</title>', '</title>\n' + scroll_js)
-    write_file(page_path, full_html)
+    scroll_js = f"<script src='{site['layout'].assets['index-scroll.js'][0]}'></script>\n"
+    if year_versions is not None:
+        scroll_js += f"<script src='{site['layout'].assets['year-index.js'][0]}' defer></script>\n"
+    return full_html.replace('</title>', '</title>\n' + scroll_js)
+
+
+def render_search_page(site: dict) -> str:
+    """Search form; SEARCH_SCRIPT looks queries up in docs/search/."""
+    root = site['root']
+    page_dir = os.path.join(root, os.path.dirname(SEARCH_PAGE))
+    _, years = page_dependencies(site, ('search',))
+    rel_root = os.path.relpath(root, page_dir)
+    options = "".join(f"<option value='{y}'>{y}年</option>" for y in years)
+    content = "\n".join([
+        "<br><B><font color='#aaaaff'>【記事検索】</font></B><br><br>",
+        f"<form id='search-form' action='index.html' data-base='{rel_root}/'>",
+        "<input type='search' name='q' size='30' placeholder='タイトル・本文から検索'>",
+        f"<select name='year'><option value=''>すべての年</option>{options}</select>",
+        "<input type='submit' value='検索'>",
+        "</form>",
+        "<div id='search-status' style='margin:1em 0;'></div>",
+        "<div id='search-results'></div>",
+        f"<noscript>検索にはJavaScriptが必要です。<a href='{rel_root}/index.html'>全記事一覧</a>をご利用ください。</noscript>",
+        f"<script src='{rel_root}/{site['layout'].assets['search.js'][0]}' defer></script>",
+    ])
+    return site['layout'].page('記事検索', content, page_dir, '')
+
+
+def render_entry_page(site: dict, anchor: str) -> str:
+    """Page of a single entry (--permalinks), with links to the older and
+    newer entry and only the top links in the sidebar."""
+    root = site['root']
+    index: BlogIndex = site['index']
+    entry = index.entry(anchor)
+    path = permalink_path(entry)
+    page_dir = os.path.join(root, os.path.dirname(path))
+    older, newer = index.entry_neighbours(anchor)
+
+    def entry_link(other: Entry | None, label: str) -> str:
+        if other is None:
+            return f"<span style='color:#ccc'>{label}</span>"
+        href = posixpath.relpath(permalink_path(other), posixpath.dirname(path))
+        return f"<a href='{href}' title='{other.title_html}'>{label}</a>"
+
+    navigation = f"{entry_link(newer, '次の記事へ')} | {entry_link(older, '前の記事へ')}"
+    rel_root = os.path.relpath(root, page_dir)
+    month_link = f"{rel_root}/archive/{entry.year}/{entry.month}.html#{anchor}"
+    pos_html = f"<a href='{month_link}'>{entry.year}年{entry.month}月</a>"
+    entry_html = site['fragments'].block(entry, None, page_dir, root)
+    return site['layout'].page(entry.title, entry_html, page_dir, navigation,
+                               f"{entry.year}年{entry.month}月", pos_html, compact=True)
+
+
+PAGE_RENDERERS = {
+    'month': render_month_page,
+    'category': render_category_page,
+    'top': render_top_page,
+    'master': render_master_index,
+    'search': render_search_page,
+    'entry': render_entry_page,
+}
+
+
+def render_page(site: dict, spec: tuple) -> str:
+    return PAGE_RENDERERS[spec[0]](site, *spec[1:])
+
+
+# -------------------------
+# Page rendering (serial or process pool)
+# -------------------------
+
+# Per-worker state, set once by _init_worker so the shared indexes are
+# pickled once per process rather than once per page.
+_worker_site: dict | None = None
+_worker_writer: SiteWriter | None = None
+
+
+def _init_worker(site: dict):
+    global _worker_site, _worker_writer
+    _worker_site = site
+    _worker_writer = SiteWriter(site['root'])
+
+
+def _render_worker(job: tuple[tuple, str]) -> tuple[str, bool, tuple[int, int] | None]:
+    spec, path = job
+    content = render_page(_worker_site, spec)
+    sizes = None
+    if _worker_site.get('minify'):
+        before = len(content.encode('utf-8'))
+        content = minify_html(content).encode('utf-8')
+        sizes = (before, len(content))
+    return path, _worker_writer.write(path, content), sizes
+
+
+def render_pages(site: dict, jobs_list: list[tuple[tuple, str]], writer: SiteWriter, jobs: int = 1,
+                 profile: BuildProfile | None = None, minify_stats: MinifyStats | None = None):
+    """Render and write each (spec, path) job, using ``jobs`` processes.
 
-    # Ensure GitHub pages skips Jekyll processing
-    write_file(os.path.join(root, '.nojekyll'), '')
+    With ``site['minify']`` pages go through :func:`minify_html`; the sizes
+    before and after are added to ``minify_stats``.
+    """
+    profile = profile or BuildProfile()
+    minify_stats = minify_stats if minify_stats is not None else MinifyStats()
+    if jobs <= 1 or len(jobs_list) < 2:
+        for spec, path in jobs_list:
+            with profile.phase('render_' + spec[0]):
+                content = render_page(site, spec)
+            if site.get('minify'):
+                with profile.phase('minify'):
+                    before = len(content.encode('utf-8'))
+                    content = minify_html(content).encode('utf-8')
+                    minify_stats.add(spec[0], before, len(content))
+            with profile.phase('write'):
+                writer.write(path, content)
+        return
+    # Rendering and writing both happen in the workers
+    chunksize = max(1, len(jobs_list) // (jobs * 4))
+    with profile.phase('render_pool'), \
+            ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(site,)) as pool:
+        for (spec, _), (path, written, sizes) in zip(jobs_list, pool.map(_render_worker, jobs_list,
+                                                                         chunksize=chunksize)):
+            writer.record(path, written)
+            if sizes:
+                minify_stats.add(spec[0], *sizes)
+
+
+def select_entries(pending: list[Entry] | None = None) -> list[Entry]:
+    """Parse sources and return the entries to publish, oldest → newest.
+
+    Entries held back because of their date are appended to ``pending``.
+    """
+    all_entries = [e for e in parse_entries() if e.date]
+    now_jst = datetime.now(JST)
+
+    # 環境変数から実行環境を判定、GitHub上で実行されたときとそれ以外で処理分岐
+    # (日付が未来なら生成HTMLから無視する処理など)
+    if is_running_on_github():
+        # GitHubなら日付判定する
+        entries = [e for e in all_entries if e.date <= now_jst]
+        if pending is not None:
+            pending.extend(e for e in all_entries if e.date > now_jst)
+    else:
+        # ローカルなら全部出す
+        entries = all_entries
+
+    entries.sort(key=lambda e: e.date)  # oldest → newest
+    return entries
+
+
+def build(incremental: bool = False, jobs: int = 1, profile: BuildProfile | None = None,
+          thumbnail_width: int | None = None, lazy_extended: bool = False, minify: bool = False,
+          search: bool = False, permalinks: bool = False, top_shell: bool = False,
+          sharded_index: bool = False, shared_sidebar: bool = False, options: dict | None = None):
+    """Generate the whole site under docs/.
+
+    With ``incremental`` set, pages whose inputs (entries shown, navigation,
+    sidebar state and templates) are unchanged since the last build recorded
+    in the manifest are left untouched. ``jobs`` > 1 renders pages in a
+    process pool; the output is identical to the serial build. Timings and
+    counters are recorded in ``profile`` if given. With ``thumbnail_width``
+    images wider than that get srcset thumbnails (see :func:`build_thumbnails`).
+    ``lazy_extended`` moves every EXTENDED BODY into a file of its own that
+    is fetched when the reader opens it. ``minify`` passes every page
+    through :func:`minify_html` and reports the bytes saved. ``search``
+    adds the search page and its index (see :func:`write_search_index`).
+    ``permalinks`` adds a page per entry (:func:`permalink_path`), which the
+    link buttons then copy. ``top_shell`` turns the top page into a small
+    shell loading cacheable parts (see :func:`write_top_parts`), and
+    ``sharded_index`` moves the titles of the master index into a file
+    per year (:func:`write_year_indexes`). ``shared_sidebar`` writes the
+    sidebar once (:data:`SHARED_SIDEBAR_PAGE`) instead of into every page,
+    so a new entry no longer re-renders every page. ``options`` (the output options
+    as passed on the command line) go into the publish schedule that
+    :func:`build_due` checks.
+    """
+    profile = profile or BuildProfile()
+    with profile.phase('parse'):
+        pending: list[Entry] = []
+        entries = select_entries(pending)
+    root = 'docs'
+    writer = SiteWriter(root)
+
+    with profile.phase('group'):
+        site = prepare_site(entries, load_cat_dir_map(), root)
+        site['lazy_extended'] = lazy_extended
+        site['minify'] = minify
+        site['search'] = search
+        site['permalinks'] = permalinks
+        site['top_shell'] = top_shell
+        site['sharded_index'] = sharded_index
+        site['shared_sidebar'] = shared_sidebar
+        templates = load_templates()
+        site['asset_versions'] = asset_versions(templates, root)
+        site['layout'] = PageLayout(site, templates)
+
+    missing = missing_assets(entries, root)
+    if missing:
+        report_missing_assets(missing)
+        print(f"{len(missing)} referenced asset(s) missing from docs/ and source dirs")
+
+    with profile.phase('fragments'):
+        templates_digest = {path.replace(os.sep, '/'): file_digest(path) for path in TEMPLATE_FILES}
+        templates_digest['scripts/build.py'] = file_digest(os.path.abspath(__file__))
+        layout_sig = layout_signature(site, templates_digest)
+        image_sizes = ImageSizes()
+        image_sizes.load({ref for e in entries for ref in e.asset_refs}, root)
+        image_sizes.save()
+
+    thumbnails = {}
+    if thumbnail_width:
+        with profile.phase('thumbnails'):
+            # Thumbnails are made once per image, so use every core even for a serial build
+            refs = srcset_candidates(entries, image_sizes.sizes)
+            thumbnails = build_thumbnails(image_sizes, refs, writer, thumbnail_width,
+                                          jobs if jobs > 1 else os.cpu_count() or 1, root)
+
+    with profile.phase('fragments'):
+        entry_digests = {e.anchor_id: entry_digest(e, image_sizes.sizes, thumbnails) for e in entries}
+        fragments = EntryFragments(FRAGMENT_CACHE_PATH, templates_digest['scripts/build.py'],
+                                   image_sizes.sizes, thumbnails, lazy_extended, permalinks)
+        fragments.prepare(entries, entry_digests)
+        site['fragments'] = fragments
+
+    if lazy_extended:
+        with profile.phase('extended'):
+            for e in entries:
+                if e.extended:
+                    writer.write(os.path.join(root, extended_path(e)),
+                                 render_extended_file(e, image_sizes.sizes, thumbnails))
+
+    if top_shell and site['index'].months:
+        with profile.phase('top_shell'):
+            site['top_parts'] = write_top_parts(site, writer)
+
+    if shared_sidebar:
+        content = site['layout'].full_sidebar(os.path.join(root, *SHARED_SIDEBAR_PAGE.split('/')[:-1]))
+        writer.write(os.path.join(root, *SHARED_SIDEBAR_PAGE.split('/')),
+                     minify_html(content) if minify else content)
+
+    if sharded_index:
+        with profile.phase('year_indexes'):
+            site['year_indexes'] = write_year_indexes(site, writer)
+
+    old_manifest = load_manifest(root)
+    search_shards = {}
+    if search:
+        with profile.phase('search'):
+            search_shards = write_search_index(site, writer, entry_digests, templates_digest['scripts/build.py'],
+                                               old_manifest.get('search', {}))
+
+    with profile.phase('plan'):
+        old_pages = old_manifest.get('pages', {}) if incremental else {}
+        pages: dict[str, dict] = {}
+        to_render: list[tuple[tuple, str]] = []
+        for spec in plan_pages(site):
+            path = page_path(site, spec)
+            rel = os.path.relpath(path, root).replace(os.sep, '/')
+            sig, anchors = page_signature(site, spec, layout_sig, entry_digests)
+            pages[rel] = {'sig': sig, 'entries': anchors}
+            old = old_pages.get(rel)
+            if old and old.get('sig') == sig and os.path.exists(path):
+                writer.keep(path)
+                continue
+            to_render.append((spec, path))
+            profile.count('entries_rendered', len(anchors))
+
+    minify_stats = MinifyStats()
+    render_pages(site, to_render, writer, jobs, profile, minify_stats)
+    if minify_stats.families:
+        print(minify_stats.format())
+    if incremental:
+        print(f"incremental build: {len(to_render)} page(s) rendered, {len(pages) - len(to_render)} up to date")
+
+    with profile.phase('write'):
+        fragments.save()
+        save_manifest(writer, {
+            'version': MANIFEST_VERSION,
+            'templates': templates_digest,
+            'layout': layout_sig,
+            'entries': entry_digests,
+            'pages': pages,
+            'search': search_shards,
+        })
+        save_schedule(writer, pending, build_inputs_digest(options or {}, root))
+
+        # Ensure GitHub pages skips Jekyll processing
+        writer.write(os.path.join(root, '.nojekyll'), '')
+        for path, content in site['layout'].assets.values():
+            writer.write(os.path.join(root, path), content)
+
+        # Pages that are no longer generated (e.g. a category that lost entries)
+        # and thumbnails of images that were replaced or are no longer used
+        writer.sweep(GENERATED_PAGES + GENERATED_THUMBNAILS + GENERATED_EXTENDED + GENERATED_ASSETS
+                     + GENERATED_SEARCH + GENERATED_PERMALINKS)
+    print(writer.summary())
+
+    profile.count('entries', len(entries))
+    profile.count('pages', len(pages))
+    profile.count('pages_rendered', len(to_render))
+    profile.count('files_written', len(writer.written))
+    profile.count('files_unchanged', writer.skipped)
+    profile.count('files_deleted', len(writer.deleted))
+    profile.count('bytes_written', writer.bytes_written)
+    if minify:
+        profile.count('minify_saved_bytes', minify_stats.saved)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Build the dev blog HTML under docs/ from source_txt/.")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"only regenerate pages whose inputs changed since the last build (uses docs/{MANIFEST_NAME})")
+    parser.add_argument('--jobs', '-j', type=int, default=1, metavar='N',
+                        help="render pages in N worker processes (0 = one per CPU core)")
+    parser.add_argument('--thumbnails', nargs='?', type=int, const=THUMBNAIL_MIN_WIDTH, metavar='WIDTH',
+                        help="add srcset thumbnails (docs/thumbs/, needs Pillow) for images wider than "
+                             f"WIDTH px (default: {THUMBNAIL_MIN_WIDTH})")
+    parser.add_argument('--lazy-extended', action='store_true',
+                        help=f"write each EXTENDED BODY to docs/{EXTENDED_DIR}/ and load it when opened "
+                             "instead of embedding it in every page")
+    parser.add_argument('--minify', action='store_true',
+                        help="strip comments and indentation from the generated pages (keeps <pre>, "
+                             "scripts and full-width spaces) and report the bytes saved per page type")
+    parser.add_argument('--search', action='store_true',
+                        help=f"write a full-text search index (docs/{SEARCH_DIR}/, one file per year) "
+                             f"and the search page docs/{SEARCH_PAGE}")
+    parser.add_argument('--permalinks', action='store_true',
+                        help=f"write a page per entry (docs/{PERMALINK_DIR}/<year>/<anchor>.html) and make "
+                             "the link buttons copy its URL")
+    parser.add_argument('--top-shell', action='store_true',
+                        help="make the uncached top page a small shell that loads its entries and sidebar "
+                             "from content-named (cacheable) files in docs/archive/top/")
+    parser.add_argument('--sharded-index', action='store_true',
+                        help="list only the years (with entry counts) on docs/index.html and load the titles of "
+                             "a year from docs/archive/<year>/index.html when it is opened")
+    parser.add_argument('--shared-sidebar', action='store_true',
+                        help=f"write the sidebar (latest entries, categories, months) once to docs/{SHARED_SIDEBAR_PAGE} "
+                             "and load it from there, so that a new entry does not change every page")
+    parser.add_argument('--if-due', action='store_true',
+                        help=f"exit without building unless a future-dated entry has become due or the sources, "
+                             f"assets, templates, options or secret changed since the last build "
+                             f"(see docs/{SCHEDULE_NAME}); "
+                             "implies --incremental")
+    parser.add_argument('--profile', nargs='?', const='build_profile.json', metavar='FILE',
+                        help="print wall/CPU time and peak RSS per build phase and save them "
+                             "as JSON to FILE (default: build_profile.json)")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="with --profile, also trace the peak Python allocations of every phase "
+                             "(tracemalloc; makes the build several times slower)")
+    parser.add_argument('--cprofile', metavar='FILE',
+                        help="with --profile, dump cProfile stats of the slowest phase to FILE")
+    args = parser.parse_args(argv)
+    options = {'thumbnails': args.thumbnails, 'lazy_extended': args.lazy_extended, 'minify': args.minify,
+               'search': args.search, 'permalinks': args.permalinks, 'top_shell': args.top_shell,
+               'sharded_index': args.sharded_index, 'shared_sidebar': args.shared_sidebar}
+    if args.if_due:
+        reason = build_due(options)
+        if reason is None:
+            print("nothing due since the last build; skipped")
+            return
+        print(f"building: {reason}")
+    profile = BuildProfile(enabled=bool(args.profile), cprofile=bool(args.profile and args.cprofile),
+                           memory=args.profile_memory)
+    build(incremental=args.incremental or args.if_due, jobs=args.jobs or os.cpu_count() or 1, profile=profile,
+          thumbnail_width=args.thumbnails, lazy_extended=args.lazy_extended, minify=args.minify,
+          search=args.search, permalinks=args.permalinks, top_shell=args.top_shell,
+          sharded_index=args.sharded_index, shared_sidebar=args.shared_sidebar, options=options)
+    if args.profile:
+        print(profile.format())
+        report = profile.save(args.profile, args.cprofile)
+        print(f"profile written to {args.profile}"
+              + (f", cProfile of '{report['slowest']}' to {args.cprofile}" if args.cprofile else ""))
 
 
 if __name__ == '__main__':
-    build()
\ No newline at end of file
+    main()
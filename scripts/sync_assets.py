@@ -0,0 +1,273 @@
+"""Mirror source_img/ and source_js/ into docs/image/ and docs/js/.
+
+Replaces the git-diff based copy in the workflows, which missed files after
+force-pushes and squashed histories. Every run compares content hashes, so
+the result only depends on the trees, locally and in CI alike:
+
+* new or changed files are copied (or hard-linked with ``--link``),
+* identical files are left alone,
+* files published earlier whose source was removed (orphans) are deleted.
+
+Files under docs/image/ and docs/js/ that never came from a source (some
+images were only ever committed to docs/) are reported, and only deleted
+with ``--delete-untracked``.
+
+With ``--referenced-only`` only images some entry links to are published
+(unreferenced ones are removed from docs/image/). ``--report`` lists links
+to missing files and images nobody links to, without syncing anything.
+
+The hashes of the published files are kept in ``docs/.asset_manifest.json``
+so a run does not have to read docs/ back. Source hashes are cached by
+size and mtime in ``.build_cache/asset_hashes.json``.
+
+    python scripts/sync_assets.py [--dry-run] [--link] [--referenced-only]
+    python scripts/sync_assets.py --report
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from build import (ASSET_SOURCES, GENERATED_ASSETS, ensure_dir, file_digest,  # noqa: E402
+                   missing_assets, parse_entries, template_asset_refs)
+
+# (source directory, published directory)
+ASSET_DIRS = [(src, os.path.join('docs', sub)) for sub, src in ASSET_SOURCES]
+
+# Directories --referenced-only applies to. Scripts and stylesheets pull in
+# further files of their own (e.g. litebox images), so js/ is always synced.
+REFERENCED_ONLY_DIRS = ['image']
+
+MANIFEST_PATH = os.path.join('docs', '.asset_manifest.json')
+MANIFEST_VERSION = 1
+HASH_CACHE_PATH = os.path.join('.build_cache', 'asset_hashes.json')
+
+# Files under the published directories that are not copies of a source
+# (relative to docs/, glob patterns); never deleted as orphans. The build
+# writes its fingerprinted CSS/JS to docs/js/.
+KEEP = list(GENERATED_ASSETS)
+
+
+def list_files(root: str) -> list[str]:
+    """Relative paths (with '/') of all files below ``root``."""
+    found = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names.sort()
+        for name in sorted(file_names):
+            found.append(os.path.relpath(os.path.join(dir_path, name), root).replace(os.sep, '/'))
+    return found
+
+
+def load_json(path: str, version: int) -> dict:
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get('version') != version:
+        return {}
+    return data.get('files', {})
+
+
+def save_json(path: str, version: int, files: dict):
+    """Write ``files`` one entry per line, so changes diff cleanly in git."""
+    ensure_dir(os.path.dirname(path))
+    lines = [f"{json.dumps(k, ensure_ascii=False)}: {json.dumps(v, ensure_ascii=False)}"
+             for k, v in sorted(files.items())]
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(f'{{"version": {version}, "files": {{\n' + ',\n'.join(lines) + '\n}}\n')
+    os.replace(tmp, path)
+
+
+class HashCache:
+    """SHA-1 of files, reused while their size and mtime stay the same."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.old = load_json(path, 1)
+        self.new: dict[str, list] = {}
+
+    def sha1(self, path: str) -> str:
+        st = os.stat(path)
+        cached = self.old.get(path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            sha1 = cached[2]
+        else:
+            sha1 = file_digest(path)
+        self.new[path] = [st.st_size, st.st_mtime_ns, sha1]
+        return sha1
+
+    def save(self):
+        if self.new != self.old:
+            save_json(self.path, 1, self.new)
+
+
+def publish(src: str, dst: str, link: bool):
+    """Copy (or hard-link) ``src`` to ``dst`` atomically."""
+    dir_name = os.path.dirname(dst)
+    ensure_dir(dir_name)
+    fd, tmp = tempfile.mkstemp(dir=dir_name, prefix='.' + os.path.basename(dst), suffix='.tmp')
+    try:
+        if link:
+            os.close(fd)
+            os.unlink(tmp)
+            try:
+                os.link(src, tmp)
+            except OSError:  # other file system, or links not supported
+                link = False
+                fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        if not link:
+            with os.fdopen(fd, 'wb') as out, open(src, 'rb') as f:
+                while chunk := f.read(1 << 20):
+                    out.write(chunk)
+            os.chmod(tmp, 0o644)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def referenced_assets() -> set[str]:
+    """docs/-relative assets linked from the templates or any dated entry."""
+    refs = set(template_asset_refs())
+    for e in parse_entries():
+        if e.date:
+            refs.update(e.asset_refs)
+    return refs
+
+
+def sync(dry_run: bool = False, link: bool = False, delete_untracked: bool = False,
+         referenced: set[str] | None = None, verbose: bool = False) -> dict[str, list[str]]:
+    """Bring the published asset directories in line with their sources.
+
+    With ``referenced`` given, only those files are published from the
+    :data:`REFERENCED_ONLY_DIRS`, and referenced files are never deleted.
+    Returns the docs/-relative paths that were copied, left as is, deleted,
+    not published (``unreferenced``) or kept although they have no source
+    (``untracked``).
+    """
+    old = load_json(MANIFEST_PATH, MANIFEST_VERSION)
+    hashes = HashCache(HASH_CACHE_PATH)
+    manifest: dict[str, list] = {}
+    result: dict[str, list[str]] = {'copied': [], 'unchanged': [], 'deleted': [],
+                                    'unreferenced': [], 'untracked': []}
+
+    for src_root, dst_root in ASSET_DIRS:
+        prefix = os.path.relpath(dst_root, 'docs').replace(os.sep, '/') + '/'
+        sources = list_files(src_root) if os.path.isdir(src_root) else []
+        if referenced is not None and prefix[:-1] in REFERENCED_ONLY_DIRS:
+            result['unreferenced'] += [prefix + rel for rel in sources if prefix + rel not in referenced]
+            sources = [rel for rel in sources if prefix + rel in referenced]
+        for rel in sources:
+            src = os.path.join(src_root, rel)
+            dst = os.path.join(dst_root, rel)
+            key = prefix + rel
+            sha1 = hashes.sha1(src)
+            size = os.path.getsize(src)
+            try:
+                dst_size = os.path.getsize(dst)
+            except FileNotFoundError:
+                dst_size = None
+            known = old.get(key)
+            if dst_size == size and known is None:
+                # Not in the manifest yet (first run): compare the bytes once
+                known = [dst_size, file_digest(dst)]
+            if dst_size == size and known == [size, sha1]:
+                result['unchanged'].append(key)
+            else:
+                if not dry_run:
+                    publish(src, dst, link)
+                result['copied'].append(key)
+                if verbose:
+                    print(f"[copy] {src} → {dst}")
+            manifest[key] = [size, sha1]
+
+        published = set(sources)
+        for rel in (list_files(dst_root) if os.path.isdir(dst_root) else []):
+            key = prefix + rel
+            if rel in published or any(fnmatch.fnmatch(key, pattern) for pattern in KEEP):
+                continue
+            if referenced is not None and key in referenced:
+                result['untracked'].append(key)
+                continue
+            if key not in old and not delete_untracked:
+                result['untracked'].append(key)
+                continue
+            if not dry_run:
+                path = os.path.join(dst_root, rel)
+                os.remove(path)
+                dir_name = os.path.dirname(path)
+                while dir_name != dst_root and not os.listdir(dir_name):
+                    os.rmdir(dir_name)
+                    dir_name = os.path.dirname(dir_name)
+            result['deleted'].append(key)
+            if verbose:
+                print(f"[delete] {os.path.join(dst_root, rel)}")
+
+    if not dry_run:
+        if manifest != old:
+            save_json(MANIFEST_PATH, MANIFEST_VERSION, manifest)
+        hashes.save()
+    return result
+
+
+def report():
+    """Print links to files that do not exist and images nothing links to."""
+    entries = [e for e in parse_entries() if e.date]
+    missing = missing_assets(entries)
+    print(f"{len(missing)} referenced asset(s) missing:")
+    for ref, used_by in sorted(missing.items()):
+        where = ", ".join(f"{e.source}:{e.line_start}" for e in used_by) or "design/"
+        print(f"  {ref}  ({where})")
+
+    referenced = referenced_assets()
+    for src_root, dst_root in ASSET_DIRS:
+        prefix = os.path.relpath(dst_root, 'docs').replace(os.sep, '/') + '/'
+        if prefix[:-1] not in REFERENCED_ONLY_DIRS or not os.path.isdir(src_root):
+            continue
+        unused = [rel for rel in list_files(src_root) if prefix + rel not in referenced]
+        size = sum(os.path.getsize(os.path.join(src_root, rel)) for rel in unused)
+        print(f"{len(unused)} file(s) in {src_root}/ not referenced by any entry ({size / 2**20:.1f} MB):")
+        for rel in unused:
+            print(f"  {src_root}/{rel}")
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Sync source_img/ and source_js/ into docs/.")
+    parser.add_argument('--dry-run', '-n', action='store_true', help="only report what would change")
+    parser.add_argument('--link', action='store_true',
+                        help="hard-link new files instead of copying them (falls back to a copy)")
+    parser.add_argument('--delete-untracked', action='store_true',
+                        help="also delete files in docs/image and docs/js that never had a source")
+    parser.add_argument('--referenced-only', action='store_true',
+                        help="publish only images that some entry links to")
+    parser.add_argument('--report', action='store_true',
+                        help="list missing and unreferenced assets, then exit without syncing")
+    parser.add_argument('--verbose', '-v', action='store_true', help="list every copied and deleted file")
+    args = parser.parse_args(argv)
+
+    if args.report:
+        report()
+        return
+    referenced = referenced_assets() if args.referenced_only else None
+    result = sync(dry_run=args.dry_run, link=args.link, delete_untracked=args.delete_untracked,
+                  referenced=referenced, verbose=args.verbose)
+    prefix = "(dry run) " if args.dry_run else ""
+    print(f"{prefix}{len(result['copied'])} copied, {len(result['unchanged'])} unchanged, "
+          f"{len(result['deleted'])} orphan(s) deleted")
+    if result['unreferenced']:
+        print(f"{len(result['unreferenced'])} unreferenced image(s) not published")
+    if result['untracked']:
+        print(f"{len(result['untracked'])} file(s) in docs/ without a source (kept):")
+        for key in result['untracked']:
+            print(f"  {key}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO, 'scripts'))
+
+# A few recent years (with EXTENDED BODYs) plus the heartbeat entry keep the
+# test builds at a second or two
+SAMPLE_SOURCES = ['2025.txt', '2026.txt', 'final_letter.txt']
+
+
+@pytest.fixture
+def make_tree(tmp_path):
+    """Return a function creating a site tree (design/, scripts/, sources) to build in.
+
+    The sources are copied so tests can edit them; everything else is linked.
+    """
+    def make(name: str = 'site', sources: list[str] = SAMPLE_SOURCES) -> str:
+        root = tmp_path / name
+        root.mkdir()
+        for sub in ('design', 'scripts', 'source_img', 'source_js'):
+            os.symlink(os.path.join(REPO, sub), root / sub)
+        (root / 'source_txt').mkdir()
+        for source in sources:
+            shutil.copy(os.path.join(REPO, 'source_txt', source), root / 'source_txt' / source)
+        return str(root)
+    return make
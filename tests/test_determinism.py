@@ -0,0 +1,44 @@
+"""The generated site must not depend on Python's per-process hash seed.
+
+Extended-body ids used to come from ``hash()``, which made every rebuild
+rewrite all pages with an EXTENDED BODY (and made -j builds differ from
+serial ones).
+"""
+
+import filecmp
+import os
+import subprocess
+import sys
+
+import pytest
+
+FULL_OPTIONS = ['--lazy-extended', '--minify', '--search', '--permalinks', '--top-shell', '--sharded-index']
+
+
+def build(tree: str, seed: int, options: list[str]):
+    env = dict(os.environ, PYTHONHASHSEED=str(seed))
+    env.pop('GITHUB_ACTIONS', None)
+    subprocess.run([sys.executable, os.path.join('scripts', 'build.py'), *options],
+                   cwd=tree, env=env, check=True, capture_output=True)
+
+
+def differences(a: str, b: str) -> list[str]:
+    """Paths below ``a`` / ``b`` that exist on one side only or differ."""
+    found = []
+    cmp = filecmp.dircmp(a, b)
+    found += [os.path.join(a, name) for name in cmp.left_only + cmp.right_only + cmp.funny_files]
+    _, mismatch, errors = filecmp.cmpfiles(a, b, cmp.common_files, shallow=False)
+    found += [os.path.join(a, name) for name in mismatch + errors]
+    for sub in cmp.common_dirs:
+        found += differences(os.path.join(a, sub), os.path.join(b, sub))
+    return found
+
+
+@pytest.mark.parametrize('options', [[], FULL_OPTIONS], ids=['default', 'all-options'])
+def test_output_independent_of_hash_seed(make_tree, options):
+    trees = [make_tree(f'seed{seed}') for seed in (1, 2)]
+    for seed, tree in zip((1, 2), trees):
+        build(tree, seed, options)
+    a, b = (os.path.join(tree, 'docs') for tree in trees)
+    assert os.path.exists(os.path.join(a, 'index.html'))
+    assert differences(a, b) == []
@@ -0,0 +1,31 @@
+from build import size_img_tag
+
+SIZES = {'image/2006/a.jpg': (830, 375)}
+
+
+def sized(tag: str) -> str:
+    return size_img_tag(tag, SIZES).replace(' loading="lazy"', '').replace(' decoding="async"', '')
+
+
+def test_missing_dimension_added():
+    assert sized('<img src="../../image/2006/a.jpg" height="181">') == \
+        '<img src="../../image/2006/a.jpg" height="181" width="401">'
+    assert sized('<img src="../../image/2006/a.jpg">') == '<img src="../../image/2006/a.jpg" width="830" height="375">'
+
+
+def test_matching_dimensions_kept():
+    # Within rounding of the image's ratio: left exactly as written
+    for tag in ('<img src="../../image/2006/a.jpg" width="400" height="181">',
+                '<img src="../../image/2006/a.jpg" width=400 height=182>'):
+        assert sized(tag) == tag
+
+
+def test_distorted_dimensions_corrected():
+    assert sized('<IMG src="../../image/2006/a.jpg" width="400" height="175" alt="x">') == \
+        '<IMG src="../../image/2006/a.jpg" width="400" height="181" alt="x">'
+
+
+def test_unknown_image_and_style_size_kept():
+    for tag in ('<img src="../../image/2006/other.jpg" width="400" height="175">',
+                '<img src="../../image/2006/a.jpg" width="400" height="175" style="height:175px">'):
+        assert sized(tag) == tag
@@ -0,0 +1,104 @@
+"""Smoke checks of the optional outputs: what they write, what they reuse
+and that turning an option off removes its files again."""
+
+import glob
+import json
+import os
+import subprocess
+import sys
+
+from build import parse_entries
+
+ALL_OPTIONS = ['--lazy-extended', '--search', '--permalinks', '--top-shell', '--sharded-index', '--shared-sidebar']
+
+
+def build(tree: str, *options: str) -> str:
+    env = dict(os.environ)
+    env.pop('GITHUB_ACTIONS', None)
+    result = subprocess.run([sys.executable, os.path.join('scripts', 'build.py'), *options],
+                            cwd=tree, env=env, check=True, capture_output=True, text=True)
+    return result.stdout
+
+
+def docs_files(tree: str, pattern: str) -> list[str]:
+    return sorted(glob.glob(os.path.join(tree, 'docs', pattern)))
+
+
+def test_search_shards_reused(make_tree):
+    tree = make_tree()
+    assert "search index: 2 of 2 year file(s) rebuilt" in build(tree, '--search')
+    shard_2025 = os.path.join(tree, 'docs', 'search', '2025.json')
+    with open(shard_2025, encoding='utf-8') as f:
+        content_2025 = f.read()
+
+    # Unchanged entries: every shard is reused, by full builds too
+    assert "search index: 0 of 2 year file(s) rebuilt" in build(tree, '--search')
+
+    # A changed entry only rebuilds its own year
+    path = os.path.join(tree, 'source_txt', '2026.txt')
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text.replace("BODY:\n", "BODY:\nzyxwv検索テスト\n", 1))
+    assert "search index: 1 of 2 year file(s) rebuilt" in build(tree, '--search', '--incremental')
+    with open(os.path.join(tree, 'docs', 'search', '2026.json'), encoding='utf-8') as f:
+        terms = {term for _, group in json.load(f)['terms'] for term in group.split()}
+    assert {'zy', 'yx', 'xw', 'wv'} <= terms
+    with open(shard_2025, encoding='utf-8') as f:
+        assert f.read() == content_2025
+
+    # A shard edited or damaged by hand is not trusted
+    with open(shard_2025, 'w', encoding='utf-8') as f:
+        f.write('{}')
+    assert "search index: 1 of 2 year file(s) rebuilt" in build(tree, '--search')
+    with open(shard_2025, encoding='utf-8') as f:
+        assert f.read() == content_2025
+
+
+def test_optional_outputs_written_and_swept(make_tree):
+    tree = make_tree()
+    build(tree, *ALL_OPTIONS)
+    written = {
+        'extended': docs_files(tree, 'extended/*/*.html'),
+        'search': docs_files(tree, 'search/*.json') + docs_files(tree, 'archive/search/index.html'),
+        'permalinks': docs_files(tree, 'entry/*/*.html'),
+        'top shell': docs_files(tree, 'archive/top/*.*.html'),
+        'year indexes': docs_files(tree, 'archive/[0-9]*/index.html'),
+        'shared sidebar': docs_files(tree, 'archive/top/sidebar.html'),
+    }
+    assert all(written.values()), written
+    entries = [e for e in parse_entries(os.path.join(tree, 'source_txt'), cache_path=None) if e.date]
+    assert len(written['permalinks']) == len(entries)
+    assert len(written['extended']) == sum(1 for e in entries if e.extended)
+    with open(os.path.join(tree, 'docs', 'archive', 'top', 'index.html'), encoding='utf-8') as f:
+        top = f.read()
+    assert 'data-src=' in top and "class='entry-body'" not in top
+
+    build(tree)
+    for feature, paths in written.items():
+        assert [path for path in paths if os.path.exists(path)] == [], feature
+    assert not os.path.exists(os.path.join(tree, 'docs', 'search'))
+    with open(os.path.join(tree, 'docs', 'archive', 'top', 'index.html'), encoding='utf-8') as f:
+        assert "class='entry-body'" in f.read()
+
+
+def test_shared_sidebar_new_entry(make_tree):
+    tree = make_tree()
+    build(tree, '--shared-sidebar')
+    old_month = os.path.join(tree, 'docs', 'archive', '2025', '01.html')
+    with open(old_month, encoding='utf-8') as f:
+        content = f.read()
+    assert "<div id='sidebar' data-src='../../archive/top/sidebar.html'>" in content and '【月別】' not in content
+
+    # A new entry in a new category only changes the pages showing it and
+    # the shared sidebar, not every page
+    with open(os.path.join(tree, 'source_txt', '2026.txt'), 'a', encoding='utf-8') as f:
+        f.write("\nTITLE: 追加した記事\nCATEGORY: テスト用\nDATE: 2026-08-20 00:00:00\n-----\nBODY:\nb\n-----\n--------")
+    out = build(tree, '--shared-sidebar', '--incremental')
+    # 2026/08.html, the top page, the master index and the category page
+    assert "incremental build: 4 page(s) rendered" in out
+    with open(old_month, encoding='utf-8') as f:
+        assert f.read() == content
+    with open(os.path.join(tree, 'docs', 'archive', 'top', 'sidebar.html'), encoding='utf-8') as f:
+        sidebar = f.read()
+    assert '追加した記事' in sidebar and 'テスト用' in sidebar
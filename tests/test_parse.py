@@ -0,0 +1,63 @@
+import os
+
+from conftest import REPO
+
+from build import iter_entries
+
+APPENDED = (b"TITLE: B\nCATEGORY: \xe9\x96\x8b\xe7\x99\xba\xe6\x97\xa5\xe8\xaa\x8c\nDATE: 2026-12-01 00:00:00\n"
+            b"-----\nBODY:\nbody of B\n-----\nEXTENDED BODY:\n\n-----\n--------")
+
+
+def parse(data: bytes):
+    issues = []
+    entries = list(iter_entries(data, 'test.txt', lambda source, lineno, message: issues.append((lineno, message))))
+    return entries, issues
+
+
+def body(data: bytes, entry) -> bytes:
+    return data[entry.body_span[0]:entry.body_span[1]]
+
+
+def test_entry_appended_without_newline():
+    # The sources end with "--------" and no newline, so a new entry pasted
+    # at the end starts on a "--------TITLE: B" line
+    with open(os.path.join(REPO, 'source_txt', '2026.txt'), 'rb') as f:
+        original = f.read()
+    assert original.endswith(b"\n--------")
+    expected, issues = parse(original)
+    assert issues == []
+
+    entries, issues = parse(original + APPENDED)
+    assert [e.title for e in entries] == [e.title for e in expected] + ['B']
+    assert body(original + APPENDED, entries[-1]) == b"body of B\n"
+    assert entries[-2].line_end == expected[-1].line_end
+    assert len(issues) == 1 and 'TITLE:' in issues[0][1]
+    assert issues[0][0] == original.count(b"\n") + 1
+
+
+def test_glued_title_ends_unclosed_body():
+    data = b"TITLE: A\nDATE: 2026-01-01\n-----\nBODY:\ntext of A\n--------TITLE: B\nDATE: 2026-01-02\nBODY:\nb\n"
+    entries, issues = parse(data)
+    assert [e.title for e in entries] == ['A', 'B']
+    assert body(data, entries[0]) == b"text of A\n"
+    assert entries[0].line_end == 5
+    assert [lineno for lineno, _ in issues] == [6]
+
+
+def test_skipped_lines_are_reported():
+    data = (b"TITLE: A\nDATE: 2026-01-01\n-----\nstray header\nBODY:\na\n-----\n"
+            b"EXTENDED BODY:\nx\n-----\nleft over\n\n--------\nTITLE: B\nDATE: 2026-01-02\nBODY:\nb\n")
+    entries, issues = parse(data)
+    assert [e.title for e in entries] == ['A', 'B']
+    assert [lineno for lineno, _ in issues] == [4, 11]
+
+
+def test_delimiters_with_trailing_whitespace():
+    for entry_delimiter, section_delimiter in ((b"-------- ", b"----- "), (b"--------\t", b"-----\r")):
+        data = (b"TITLE: A\nDATE: 2026-01-01\n-----\nBODY:\na\n" + section_delimiter + b"\n"
+                b"--------\nTITLE: B\nDATE: 2026-01-02\nBODY:\nb\n" + entry_delimiter + b"\n"
+                b"TITLE: C\nDATE: 2026-01-03\nBODY:\nc\n")
+        entries, issues = parse(data)
+        assert [e.title for e in entries] == ['A', 'B', 'C'], entry_delimiter
+        assert [body(data, e) for e in entries] == [b"a\n", b"b\n", b"c\n"]
+        assert issues == []
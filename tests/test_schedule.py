@@ -0,0 +1,80 @@
+"""--if-due: skip the scheduled build until a held-back entry is due."""
+
+import json
+import os
+import re
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+from build import JST, SCHEDULE_NAME
+
+OPTIONS = ['--if-due', '--search']
+
+
+def build(tree: str, *options: str, secret: str = 'secret') -> str:
+    # On GitHub entries dated in the future are held back
+    env = dict(os.environ, GITHUB_ACTIONS='true', FINAL_LETTER_TEXT_SECRET=secret)
+    result = subprocess.run([sys.executable, os.path.join('scripts', 'build.py'), *options],
+                            cwd=tree, env=env, check=True, capture_output=True, text=True)
+    return result.stdout
+
+
+def docs_state(tree: str) -> dict[str, int]:
+    state = {}
+    for dir_path, _, file_names in os.walk(os.path.join(tree, 'docs')):
+        for name in file_names:
+            path = os.path.join(dir_path, name)
+            state[path] = os.stat(path).st_mtime_ns
+    return state
+
+
+def set_heartbeat(tree: str, date: datetime):
+    path = os.path.join(tree, 'source_txt', 'final_letter.txt')
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(re.sub(r'(?m)^DATE: .*$', f"DATE: {date:%Y-%m-%d} 00:00:00", text))
+
+
+def test_if_due(make_tree):
+    tree = make_tree()
+    schedule_path = os.path.join(tree, 'docs', SCHEDULE_NAME)
+    due = (datetime.now(JST) + timedelta(days=30)).replace(hour=0, minute=0, second=0, microsecond=0)
+    set_heartbeat(tree, due)
+
+    # No schedule yet: build, and record the held-back entry by date only
+    assert "building: no publish schedule" in build(tree, *OPTIONS)
+    with open(schedule_path, encoding='utf-8') as f:
+        text = f.read()
+    assert json.loads(text)['pending'] == [due.isoformat()]
+    assert '最後にみなさまへ' not in text
+    with open(os.path.join(tree, 'docs', 'index.html'), encoding='utf-8') as f:
+        assert '最後にみなさまへ' not in f.read()
+
+    # Nothing due, nothing changed: exit without touching docs/
+    before = docs_state(tree)
+    assert "skipped" in build(tree, *OPTIONS)
+    assert docs_state(tree) == before
+
+    # Other options than the last build: rebuild
+    assert "options changed" in build(tree, '--if-due')
+    assert "skipped" in build(tree, '--if-due')
+
+    # The date has passed (pretend so by moving it back in the schedule)
+    with open(schedule_path, 'w', encoding='utf-8') as f:
+        f.write(text.replace(due.isoformat(), (due - timedelta(days=60)).isoformat()))
+    out = build(tree, *OPTIONS)
+    assert "1 entry date(s) due" in out and "incremental build:" in out
+
+    # An edited source (e.g. the heartbeat moved) also counts
+    assert "skipped" in build(tree, *OPTIONS)
+    set_heartbeat(tree, due + timedelta(days=1))
+    assert "sources, assets, templates or options changed" in build(tree, *OPTIONS)
+
+    # So does another secret; only its hash is recorded
+    assert "skipped" in build(tree, *OPTIONS)
+    assert "options changed" in build(tree, *OPTIONS, secret='another secret')
+    with open(schedule_path, encoding='utf-8') as f:
+        assert 'another secret' not in f.read()
+    assert "skipped" in build(tree, *OPTIONS, secret='another secret')
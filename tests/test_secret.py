@@ -0,0 +1,35 @@
+"""FINAL_LETTER_TEXT_SECRET is published in the page but never cached.
+
+CI keeps .build_cache/ between runs (actions/cache), so nothing in there
+may contain the secret text.
+"""
+
+import os
+import subprocess
+import sys
+
+SECRET = 'secret-marker-7d1f0c'
+
+
+def files_containing(root: str, text: str) -> list[str]:
+    found = []
+    for dir_path, _, file_names in os.walk(root):
+        for name in file_names:
+            path = os.path.join(dir_path, name)
+            with open(path, 'rb') as f:
+                if text.encode() in f.read():
+                    found.append(os.path.relpath(path, root))
+    return found
+
+
+def test_secret_not_in_build_cache(make_tree):
+    tree = make_tree()
+    env = dict(os.environ, FINAL_LETTER_TEXT_SECRET=SECRET)
+    env.pop('GITHUB_ACTIONS', None)
+    for options in ([], ['--incremental', '-j', '2']):
+        subprocess.run([sys.executable, os.path.join('scripts', 'build.py'), *options],
+                       cwd=tree, env=env, check=True, capture_output=True)
+
+    assert files_containing(os.path.join(tree, 'docs'), SECRET)
+    assert os.path.exists(os.path.join(tree, '.build_cache', 'fragments.sqlite'))
+    assert files_containing(os.path.join(tree, '.build_cache'), SECRET) == []